@@ -3,7 +3,7 @@ import pandas as pd
 from supabase import create_client
 import plotly.express as px
 import datetime
-import requests # 新增 requests 用於呼叫 ElevenLabs API
+from modules import transport # 共用連線池呼叫 ElevenLabs API
 
 # ==========================================
 # 企業級後台 (Admin Portal V3 - 算力監控版)
@@ -53,7 +53,7 @@ def get_elevenlabs_status():
     try:
         url = "https://api.elevenlabs.io/v1/user/subscription"
         headers = {"xi-api-key": st.secrets["ELEVENLABS_API_KEY"]}
-        response = requests.get(url, headers=headers)
+        response = transport.session("elevenlabs").get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
     except: pass
@@ -2,9 +2,8 @@ import streamlit as st
 import json
 import time
 import datetime
-from openai import OpenAI
 
-from modules import ui, auth, database, audio, brain, config
+from modules import ui, auth, database, audio, brain, config, transport
 from modules.tabs import tab_voice, tab_store, tab_persona, tab_memory, tab_config
 
 import extra_streamlit_components as stx
@@ -87,7 +86,7 @@ if saved_session_json:
 # 6. 初始化 AI 與 DB
 if "SUPABASE_URL" not in st.secrets: st.stop()
 supabase = database.init_supabase()
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+client = transport.openai_client() # 與各模組共用同一個連線池
 
 @st.cache_data
 def load_questions():
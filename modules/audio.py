@@ -1,10 +1,14 @@
 import streamlit as st
-import requests
 import io
-from openai import OpenAI
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pydub import AudioSegment
+from pydub.silence import detect_leading_silence
 from .auth import get_current_user_id
 from .config import ROLE_MAPPING
+from . import tts, tts_cache, metrics, state, mp3, mixer, transport
+from .cache import LRUCache
 
 def get_tts_engine_type(profile):
     return "elevenlabs"
@@ -13,27 +17,25 @@ def generate_speech(text, tier, specific_voice_id=None):
     """
     生成語音
     specific_voice_id: 若有指定(例如訪客的暫時ID)，則使用該ID，否則用系統預設
+    引擎選擇、逾時、快取與故障轉移見 tts.py
     """
     voice_id = specific_voice_id if specific_voice_id else st.secrets['VOICE_ID']
-    
-    # 1. ElevenLabs
-    try:
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        headers = {"xi-api-key": st.secrets['ELEVENLABS_API_KEY'], "Content-Type": "application/json"}
-        data = {"text": text, "model_id": "eleven_multilingual_v2", "voice_settings": {"stability": 0.5, "similarity_boost": 0.8}}
-        res = requests.post(url, json=data, headers=headers)
-        if res.status_code == 200: return res.content
-        else: print(f"EL Error: {res.text}")
-    except: pass
-    
-    # 2. OpenAI Fallback
-    try:
-        client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-        res = client.audio.speech.create(model="tts-1", voice="alloy", input=text)
-        return res.content
-    except: return None
+    # 訪客暫時聲音只放記憶體
+    data, _ = tts.synthesize(text, voice_id, persist=not specific_voice_id)
+    return data
+
+_speech_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts-bg")
+
+def start_speech(text, tier, specific_voice_id=None):
+    """
+    在背景執行緒開始合成，立即回傳 Future (結果為完整 MP3 bytes，失敗為 None)
+    呼叫端可以在等待期間做其他事 (寫資料庫、下載暱稱錄音...)
+    """
+    return _speech_pool.submit(generate_speech, text, tier, specific_voice_id)
 
 # --- 進階功能：複製訪客聲音 ---
+VOICE_API_TIMEOUT = (3.05, 60) # 上傳樣本建聲音比較久
+
 def clone_guest_voice(audio_bytes):
     """上傳訪客錄音，建立暫時 Voice ID"""
     try:
@@ -41,7 +43,7 @@ def clone_guest_voice(audio_bytes):
         headers = {"xi-api-key": st.secrets['ELEVENLABS_API_KEY']}
         files = {'files': ('guest_sample.mp3', io.BytesIO(audio_bytes), 'audio/mpeg')}
         data = {'name': 'Guest_Temp_Voice', 'description': 'Temporary guest voice'}
-        response = requests.post(url, headers=headers, data=data, files=files)
+        response = transport.session("elevenlabs").post(url, headers=headers, data=data, files=files, timeout=VOICE_API_TIMEOUT)
         if response.status_code == 200:
             return response.json()['voice_id']
         return None
@@ -52,59 +54,213 @@ def delete_voice(voice_id):
     try:
         url = f"https://api.elevenlabs.io/v1/voices/{voice_id}"
         headers = {"xi-api-key": st.secrets['ELEVENLABS_API_KEY']}
-        requests.delete(url, headers=headers)
+        transport.session("elevenlabs").delete(url, headers=headers, timeout=tts.EL_TIMEOUT)
     except: pass
 
 # --- 音訊處理 ---
-def upload_audio_file(supabase, role, audio_bytes, file_type="nickname"):
+ASSET_TABLE = "audio_assets" # 錄音檔清單 (sql/audio_assets.sql)
+BACKFILL_TABLE = "audio_asset_backfills" # 已從 Storage 回填過清單的使用者
+ASSET_TTL = 60 # 秒；其他 session 上傳的錄音最晚這麼久後看得到
+
+_manifest_locks = [threading.Lock() for _ in range(32)] # 依 user_id 分段，同一人的清單同時只查一次
+_backfilled = set() # 已確認回填過的 user_id (整個行程共用，省掉每次查標記)
+
+def _asset_key(role, file_type):
+    return (ROLE_MAPPING.get(role, "others"), file_type)
+
+# 錄音入庫格式：單聲道 44.1kHz MP3 (與 ElevenLabs 輸出一致，合併時可直接拼 frame)
+INGEST_FRAME_RATE = 44100
+INGEST_BITRATE = "64k"
+INGEST_SILENCE_DB = -45 # 低於此音量視為靜音
+INGEST_PADDING_MS = 100 # 裁切後前後保留的留白
+
+def ingest_recording(raw_bytes):
+    """
+    錄音入庫前處理：裁掉頭尾靜音 -> 轉單聲道 -> 壓成 MP3
+    st.audio_input 給的是未壓縮 WAV，原始檔只留給 train_voice_sample 用
+    失敗回傳原始 bytes
+    """
+    try:
+        seg = AudioSegment.from_file(io.BytesIO(raw_bytes))
+        start = detect_leading_silence(seg, silence_threshold=INGEST_SILENCE_DB)
+        end = len(seg) - detect_leading_silence(seg.reverse(), silence_threshold=INGEST_SILENCE_DB)
+        if end - start > 0:
+            seg = seg[max(0, start - INGEST_PADDING_MS):min(len(seg), end + INGEST_PADDING_MS)]
+        seg = seg.set_channels(1).set_frame_rate(INGEST_FRAME_RATE)
+        buffer = io.BytesIO()
+        seg.export(buffer, format="mp3", bitrate=INGEST_BITRATE)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"Ingest Error: {e}")
+        return raw_bytes
+
+def _sniff_content_type(audio_bytes):
+    head = bytes(audio_bytes[:4])
+    if head.startswith(b"RIFF"): return "audio/wav"
+    if head.startswith(b"ID3") or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0): return "audio/mpeg"
+    if head.startswith(b"OggS"): return "audio/ogg"
+    return "application/octet-stream"
+
+def _probe_duration_ms(audio_bytes):
+    # MP3 直接數 frame，不用開 ffmpeg
+    duration = mp3.duration_ms(audio_bytes)
+    if duration is not None: return duration
+    try: return len(AudioSegment.from_file(io.BytesIO(audio_bytes)))
+    except: return None
+
+def upload_audio_file(supabase, role, audio_bytes, file_type="nickname", transcode=True):
+    """
+    上傳錄音 (預設先經 ingest_recording 轉檔)
+    transcode=False: 呼叫端已經轉好 (例如同一段錄音要存兩份)
+    """
     user_id = get_current_user_id()
     if not user_id: return False
+    if transcode: audio_bytes = ingest_recording(audio_bytes)
+    content_type = _sniff_content_type(audio_bytes)
     try:
         safe = ROLE_MAPPING.get(role, "others")
         path = f"{user_id}/{file_type}_{safe}.mp3"
-        supabase.storage.from_("audio_clips").upload(path, audio_bytes, file_options={"content-type": "audio/mpeg", "upsert": "true"})
-        return True
+        supabase.storage.from_("audio_clips").upload(path, audio_bytes, file_options={"content-type": content_type, "upsert": "true"})
     except: return False
+    _audio_cache.pop((user_id, safe, file_type))
+    
+    # 同步更新錄音清單 (失敗不影響上傳結果)
+    row = {
+        "user_id": user_id, "role": safe, "file_type": file_type, "path": path,
+        "size_bytes": len(audio_bytes), "duration_ms": _probe_duration_ms(audio_bytes),
+        "sha256": hashlib.sha256(audio_bytes).hexdigest(), "content_type": content_type
+    }
+    try:
+        supabase.table(ASSET_TABLE).upsert(row, on_conflict="user_id,role,file_type").execute()
+    except Exception as e:
+        print(f"Asset Manifest Error: {e}")
+    state.bump_version("assets")
+    return True
+
+def get_asset_manifest(supabase, user_id=None):
+    """
+    取得使用者的錄音清單 {(role, file_type): {size_bytes, duration_ms, sha256, ...}}
+    session 快取：本 session 上傳會立刻重讀，其他 session 的異動靠 ASSET_TTL 過期
+    每個使用者只從 Storage 目錄列表回填一次 (清單建立前上傳的舊錄音)
+    同一頁並行的 has_audio / calculate_similarity 共用同一次查詢
+    """
+    user_id = user_id or get_current_user_id()
+    if not user_id: return {}
+    with _manifest_locks[hash(user_id) % len(_manifest_locks)]:
+        try:
+            return state.versioned("_asset_manifest", "assets", user_id,
+                                   lambda: _fetch_manifest(supabase, user_id), ASSET_TTL)
+        except Exception as e:
+            print(f"Asset Manifest Error: {e}")
+            return {}
+
+def _fetch_manifest(supabase, user_id):
+    res = supabase.table(ASSET_TABLE).select("*").eq("user_id", user_id).execute()
+    manifest = {(r['role'], r['file_type']): r for r in res.data}
+    if user_id not in _backfilled:
+        manifest = {**_backfill_manifest(supabase, user_id, manifest), **manifest}
+        _backfilled.add(user_id)
+    return manifest
+
+def _backfill_manifest(supabase, user_id, known):
+    """補上清單裡沒有的舊錄音，完成後記一筆標記 (之後不再列 Storage 目錄)"""
+    done = supabase.table(BACKFILL_TABLE).select("user_id").eq("user_id", user_id).execute()
+    if done.data: return {}
+    rows = []
+    for f in supabase.storage.from_("audio_clips").list(user_id) or []:
+        name = f.get('name', '')
+        if not name.endswith(".mp3"): continue
+        file_type, _, safe = name[:-4].rpartition("_")
+        meta = f.get('metadata') or {}
+        rows.append({
+            "user_id": user_id, "role": safe, "file_type": file_type, "path": f"{user_id}/{name}",
+            "size_bytes": meta.get('size'), "duration_ms": None, "sha256": None,
+            "content_type": meta.get('mimetype', "audio/mpeg")
+        })
+    rows = [r for r in rows if (r['role'], r['file_type']) not in known]
+    if rows: # 已有的列 (上傳時寫入，含 sha256 / 長度) 不覆蓋
+        supabase.table(ASSET_TABLE).upsert(rows, on_conflict="user_id,role,file_type", ignore_duplicates=True).execute()
+    supabase.table(BACKFILL_TABLE).upsert({"user_id": user_id}, on_conflict="user_id").execute()
+    return {(r['role'], r['file_type']): r for r in rows}
+
+def has_audio(supabase, role, file_type="nickname"):
+    """錄音是否存在 (查清單，不下載檔案)"""
+    return _asset_key(role, file_type) in get_asset_manifest(supabase)
+
+# 下載過的錄音 (整個行程共用，依位元組數 LRU 淘汰；上傳時清掉被覆蓋的那筆)
+AUDIO_CACHE_BUDGET = 32 * 1024 * 1024
+_audio_cache = LRUCache(max_bytes=AUDIO_CACHE_BUDGET)
 
 def get_audio_bytes(supabase, role, file_type="nickname"):
     user_id = get_current_user_id()
     if not user_id: return None
+    key = (user_id,) + _asset_key(role, file_type)
+    cached = _audio_cache.get(key)
+    if cached is not None: return cached
     try:
         safe = ROLE_MAPPING.get(role, "others")
         path = f"{user_id}/{file_type}_{safe}.mp3"
-        return supabase.storage.from_("audio_clips").download(path)
+        data = supabase.storage.from_("audio_clips").download(path)
+        if data: _audio_cache.put(key, data)
+        return data
     except: return None
 
+def audio_cache_stats():
+    """命中率與常駐位元組數 (用來估算每台機器要給多少記憶體)"""
+    return _audio_cache.stats()
+
 def train_voice_sample(audio_bytes):
     try:
         url = f"https://api.elevenlabs.io/v1/voices/{st.secrets['VOICE_ID']}/edit"
         files = {'files': ('training_sample.mp3', audio_bytes, 'audio/mpeg')}
-        requests.post(url, headers={"xi-api-key": st.secrets['ELEVENLABS_API_KEY']}, data={'name': 'Clone'}, files=files)
+        transport.session("elevenlabs").post(url, headers={"xi-api-key": st.secrets['ELEVENLABS_API_KEY']}, data={'name': 'Clone'}, files=files, timeout=VOICE_API_TIMEOUT)
+        # 聲音變了，舊的合成快取作廢
+        tts_cache.invalidate_voice(st.secrets['VOICE_ID'])
         return True
     except: return False
 
 def merge_audio_clips(intro_bytes, main_bytes):
     try:
         if not intro_bytes: return main_bytes
-        intro = AudioSegment.from_file(io.BytesIO(intro_bytes))
-        main = AudioSegment.from_file(io.BytesIO(main_bytes))
-        silence = AudioSegment.silent(duration=300)
-        combined = intro + silence + main
-        buffer = io.BytesIO()
-        combined.export(buffer, format="mp3")
-        return buffer.getvalue()
+        # 格式相同直接拼 frame，不經 ffmpeg；否則解碼一次、編碼一次
+        spliced = mp3.splice([intro_bytes, main_bytes], 300)
+        if spliced: return spliced
+        return mixer.mix([intro_bytes, main_bytes], 300)
     except: return main_bytes
 
 def merge_dialogue(dialogue_list):
     """合併多段對話音訊 (List of bytes)"""
     try:
-        combined = AudioSegment.empty()
-        silence = AudioSegment.silent(duration=400) # 對話間隔
-        for audio_data in dialogue_list:
-            if audio_data:
-                seg = AudioSegment.from_file(io.BytesIO(audio_data))
-                combined += seg + silence
-        buffer = io.BytesIO()
-        combined.export(buffer, format="mp3")
-        return buffer.getvalue()
+        # 格式相同直接拼 frame，不經 ffmpeg；否則解碼一次、編碼一次
+        spliced = mp3.splice(dialogue_list, 400, trailing_gap=True)
+        if spliced: return spliced
+        return mixer.mix(dialogue_list, 400, trailing_gap=True)
     except: return None
+
+def _merge_dialogue_legacy(dialogue_list):
+    """舊版 pydub 串接 (只留給 benchmark_merge 對照用)"""
+    combined = AudioSegment.empty()
+    silence = AudioSegment.silent(duration=400) # 對話間隔
+    for audio_data in dialogue_list:
+        if audio_data:
+            seg = AudioSegment.from_file(io.BytesIO(audio_data))
+            combined += seg + silence
+    buffer = io.BytesIO()
+    combined.export(buffer, format="mp3")
+    return buffer.getvalue()
+
+def benchmark_merge(dialogue_list):
+    """
+    比較三種合併路徑的耗時、CPU 與峰值記憶體
+    回傳: {"splice": {...} 或 None(格式不符), "numpy": {...}, "pydub": {...}}
+    """
+    results = {}
+    for name, fn in {
+        "splice": lambda: mp3.splice(dialogue_list, 400, trailing_gap=True),
+        "numpy": lambda: mixer.mix(dialogue_list, 400, trailing_gap=True),
+        "pydub": lambda: _merge_dialogue_legacy(dialogue_list),
+    }.items():
+        out, stats = mixer.profile(fn)
+        results[name] = stats if out else None
+        if out: metrics.record(f"audio.merge.{name}", stats["wall"])
+    return results
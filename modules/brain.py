@@ -1,13 +1,13 @@
 import streamlit as st
 import google.generativeai as genai
-from openai import OpenAI
 import json
 import re
+from modules import transcribe, script_cache, router, transport
 
 # 初始化
 try:
     genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-    client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+    client = transport.openai_client()
 except: pass
 
 def get_tier_config(tier):
@@ -15,30 +15,96 @@ def get_tier_config(tier):
     return "gemini-1.5-flash", "標準思維"
 
 def transcribe_audio(audio_file):
-    """語音轉文字 (Whisper)"""
-    try:
-        transcript = client.audio.transcriptions.create(model="whisper-1", file=audio_file)
-        return transcript.text
-    except: return ""
+    """語音轉文字 (Whisper，同一段錄音只轉一次，見 transcribe.py)"""
+    return transcribe.transcribe(audio_file)
 
 def think_and_reply(tier, persona, memories, user_text, has_nick):
-    """一般對話 (優先用 Gemini，失敗轉 OpenAI)"""
+    """一般對話 (優先用 Gemini，慢或故障時由路由器改送/對沖 OpenAI)"""
+    nick_instr = "回應開頭不要包含暱稱。" if has_nick else "請在開頭自然呼喚對方的暱稱。"
+    prompt = f"【角色】{persona}\n【回憶】{memories}\n【規則】1.{nick_instr} 2.語氣自然。\n【用戶】{user_text}"
+
+    def _gemini(timeout):
+        model = genai.GenerativeModel("gemini-1.5-flash")
+        return model.generate_content(prompt, request_options={"timeout": timeout}).text
+
+    def _openai(timeout):
+        res = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": f"{persona}\n{user_text}"}]
+        )
+        return res.choices[0].message.content
+
     try:
-        # 1. 嘗試 Google Gemini
+        return router.call([("gemini/gemini-1.5-flash", _gemini), ("openai/gpt-4o-mini", _openai)], deadline=20, hedge=True)
+    except Exception as e:
+        return f"思考暫時中斷: {e}"
+
+def complete_json(prompt, openai_model="gpt-4o", gemini_model="gemini-1.5-pro", deadline=90, hedge=False):
+    """
+    JSON 模式的單次生成 (OpenAI 優先，Gemini 備援)，回傳 dict/list
+    長文分析很貴，預設不對沖，只靠斷路器與失敗轉送
+    """
+    def _openai(timeout):
+        res = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+            model=openai_model,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={ "type": "json_object" }
+        )
+        return json.loads(res.choices[0].message.content)
+
+    def _gemini(timeout):
+        model = genai.GenerativeModel(gemini_model, generation_config={"response_mime_type": "application/json"})
+        return json.loads(model.generate_content(prompt, request_options={"timeout": timeout}).text)
+
+    return router.call([(f"openai/{openai_model}", _openai), (f"gemini/{gemini_model}", _gemini)], deadline=deadline, hedge=hedge)
+
+# 句尾標點 (連續的標點算同一句，例如「！！」「……」)
+_SENTENCE_RE = re.compile(r"[^。！？…!?\n]*[。！？…!?\n]+")
+
+def split_sentences(buffer):
+    """切出完整句子，回傳 (句子列表, 尚未結束的尾巴)"""
+    sentences, end = [], 0
+    for m in _SENTENCE_RE.finditer(buffer):
+        if m.group().strip(): sentences.append(m.group().strip())
+        end = m.end()
+    return sentences, buffer[end:]
+
+def stream_reply_sentences(tier, persona, memories, user_text, has_nick):
+    """
+    串流版 think_and_reply：邊生成邊以句子為單位吐出 (generator)
+    經過路由器 (斷路器 + 健康統計)：Gemini 串流失敗且尚未吐出任何內容時，改用 OpenAI 串流
+    """
+    nick_instr = "回應開頭不要包含暱稱。" if has_nick else "請在開頭自然呼喚對方的暱稱。"
+    prompt = f"【角色】{persona}\n【回憶】{memories}\n【規則】1.{nick_instr} 2.語氣自然。\n【用戶】{user_text}"
+
+    def _gemini(timeout):
         model = genai.GenerativeModel("gemini-1.5-flash")
-        nick_instr = "回應開頭不要包含暱稱。" if has_nick else "請在開頭自然呼喚對方的暱稱。"
-        prompt = f"【角色】{persona}\n【回憶】{memories}\n【規則】1.{nick_instr} 2.語氣自然。\n【用戶】{user_text}"
-        return model.generate_content(prompt).text
-    except:
-        # 2. 失敗則用 OpenAI 救援
-        try:
-            res = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": f"{persona}\n{user_text}"}]
-            )
-            return res.choices[0].message.content
-        except Exception as e:
-            return f"思考暫時中斷: {e}"
+        for chunk in model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            yield chunk.text
+
+    def _openai(timeout):
+        res = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": f"{persona}\n{user_text}"}],
+            stream=True
+        )
+        for chunk in res:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    emitted, buffer = False, ""
+    try:
+        for piece in router.stream([("gemini/gemini-1.5-flash", _gemini), ("openai/gpt-4o-mini", _openai)], deadline=30):
+            sentences, buffer = split_sentences(buffer + piece)
+            for sentence in sentences:
+                emitted = True
+                yield sentence
+        if buffer.strip(): yield buffer.strip()
+        return
+    except Exception as e:
+        print(f"Stream Reply Error: {e}")
+        if emitted: return # 已經講一半，不換模型重講
+    yield "思考暫時中斷，請再說一次。"
 
 def generate_crosstalk_script(question, correct_answer, user_answer, member_name):
     """
@@ -66,43 +132,44 @@ def generate_crosstalk_script(question, correct_answer, user_answer, member_name
        -> 答錯：A 瘋狂吐槽或給出超明顯提示，B 硬拗說自己是在測試 A 知不知道。
     
     【JSON 輸出格式要求】
-    請回傳一個 JSON 物件，包含一個鍵值 "dialogue"，內容是列表。範例：
+    請回傳一個 JSON 物件，包含一個鍵值 "dialogue"，內容是列表。
+    台詞裡提到 A 的名字時，一律寫成「{{member}}」這個佔位符，不要寫出真正的名字。範例：
     {{
         "dialogue": [
             {{"speaker": "member", "text": "哇靠！你是不是偷看劇本？"}},
-            {{"speaker": "guest", "text": "拜託，這種小兒科題目，我用膝蓋想都知道。"}},
+            {{"speaker": "guest", "text": "拜託 {{member}}，這種小兒科題目，我用膝蓋想都知道。"}},
             {{"speaker": "member", "text": "少來，下次出個難一點的！"}}
         ]
     }}
     """
     
+    # 相同題目 + 相同對錯 + 相近回答直接沿用舊劇本 (會員名字會換成當前會員)
+    cached = script_cache.lookup(question, correct_answer, user_answer, member_name)
+    if cached: return cached
+
     try:
-        # 使用 OpenAI 生成 (穩定性最高)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={ "type": "json_object" }
-        )
-        
-        content = response.choices[0].message.content
-        data = json.loads(content)
-
-        # 智慧解析 JSON
-        if isinstance(data, list): return data
-        if isinstance(data, dict):
-            for key in ['dialogue', 'script', 'conversation', 'lines']:
-                if key in data and isinstance(data[key], list):
-                    return data[key]
-            for value in data.values():
-                if isinstance(value, list):
-                    return value
-
-        raise ValueError("JSON 格式不符")
+        # OpenAI 優先 (穩定性最高)，慢的話對沖 Gemini
+        data = complete_json(prompt, openai_model="gpt-4o-mini", gemini_model="gemini-1.5-flash", deadline=15, hedge=True)
+        script = _parse_script(data)
+        script_cache.store(question, correct_answer, user_answer, member_name, script)
+        return script_cache.fill_member(script, member_name)
         
     except Exception as e:
         print(f"Script Error: {e}")
         return get_fallback_script(correct_answer, user_answer)
 
+def _parse_script(data):
+    """智慧解析 JSON：找出台詞列表"""
+    if isinstance(data, list): return data
+    if isinstance(data, dict):
+        for key in ['dialogue', 'script', 'conversation', 'lines']:
+            if key in data and isinstance(data[key], list):
+                return data[key]
+        for value in data.values():
+            if isinstance(value, list):
+                return value
+    raise ValueError("JSON 格式不符")
+
 def get_fallback_script(correct_answer, user_answer):
     """備用劇本"""
     return [
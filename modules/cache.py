@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+
+# ==========================================
+# 通用 LRU 快取 (執行緒安全，可依筆數或位元組數設上限)
+# ==========================================
+
+class LRUCache:
+    def __init__(self, max_items=None, max_bytes=None, sizeof=len):
+        """
+        max_items: 最多保留幾筆 (None = 不限)
+        max_bytes: 最多佔用多少位元組 (None = 不限，依 sizeof 計算)
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self._sizeof(value) if self.max_bytes else 0
+        # 單筆就超過預算：不快取
+        if self.max_bytes and size > self.max_bytes: return
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizeof(self._data.pop(key)) if self.max_bytes else 0
+            self._data[key] = value
+            self._bytes += size
+            while self._data and (
+                (self.max_items and len(self._data) > self.max_items) or
+                (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                _, old = self._data.popitem(last=False)
+                self._bytes -= self._sizeof(old) if self.max_bytes else 0
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            if key not in self._data: return None
+            value = self._data.pop(key)
+            self._bytes -= self._sizeof(value) if self.max_bytes else 0
+            return value
+
+    def discard_where(self, predicate):
+        """刪除所有 key 符合條件的項目，回傳刪除筆數"""
+        with self._lock:
+            doomed = [k for k in self._data if predicate(k)]
+            for k in doomed:
+                value = self._data.pop(k)
+                self._bytes -= self._sizeof(value) if self.max_bytes else 0
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "items": len(self._data),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
@@ -7,3 +7,13 @@ ROLE_MAPPING = {
     "兒子/女兒/晚輩": "junior",
     "長輩/父親/母親/爺爺/奶奶": "elder"
 }
+
+# 訪客流程固定台詞 (預先合成進語音包，見 prompt_pack.py)
+GUEST_PROMPTS = {
+    "opening_ask": "你聽聽看這個AI分身怎麼樣？幫我打個分數。",
+    "thanks": "謝啦！... 幫我等級加了1分。... 現在解鎖腦筋急轉彎模式！... 答對有彩蛋！！.........",
+    "retry": "哎呀... 訊號不好，我沒聽清楚。... 麻煩你幫我唸這句測試一下... ",
+}
+
+# 腦筋急轉彎出題台詞
+TEASER_PROMPT = "...請問!...{q}，猜猜看是什麼？"
@@ -0,0 +1,41 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from modules import audio, brain, metrics
+
+# ==========================================
+# 串流對話：LLM 逐句生成 -> 逐句 TTS (管線化)
+# ==========================================
+# 第 1 句一生成完就開始合成語音，同時 LLM 繼續寫第 2 句
+# 首段語音延遲 = 第一句生成時間 + 第一句 TTS，而不是整段回覆 + 整段 TTS
+
+_tts_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="reply-tts")
+
+def reply_stream(tier, persona, memories, user_text, has_nick, specific_voice_id=None):
+    """
+    依序吐出 (句子, 語音 bytes)，語音可能為 None (TTS 失敗)
+    指標：conversation.first_sentence / conversation.first_audio / conversation.total (秒)
+    """
+    start = time.perf_counter()
+    pending = deque()
+    first_audio = True
+
+    def _ready():
+        nonlocal first_audio
+        sentence, future = pending.popleft()
+        clip = future.result()
+        if first_audio:
+            metrics.record("conversation.first_audio", time.perf_counter() - start)
+            first_audio = False
+        return sentence, clip
+
+    for i, sentence in enumerate(brain.stream_reply_sentences(tier, persona, memories, user_text, has_nick)):
+        if i == 0: metrics.record("conversation.first_sentence", time.perf_counter() - start)
+        pending.append((sentence, _tts_pool.submit(audio.generate_speech, sentence, tier, specific_voice_id)))
+        # 前面的句子合成好了就先吐出去，不必等 LLM 寫完
+        while pending and pending[0][1].done():
+            yield _ready()
+
+    while pending:
+        yield _ready()
+    metrics.record("conversation.total", time.perf_counter() - start)
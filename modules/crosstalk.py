@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules import audio, brain, metrics
+
+# ==========================================
+# 雙人相聲生成引擎 (平行 + 管線化)
+# ==========================================
+# 1. 複製訪客聲音 與 生成劇本 同時進行
+# 2. 劇本一出來，member 的台詞立刻開始 TTS；guest 的台詞等 Voice ID 好了再送
+# 3. 依劇本順序組裝音檔
+
+MAX_TTS_WORKERS = 4 # 同時送出的 TTS 請求上限 (避免打爆 ElevenLabs 併發限制)
+
+_stage_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="crosstalk-stage")
+_tts_pool = ThreadPoolExecutor(max_workers=MAX_TTS_WORKERS, thread_name_prefix="crosstalk-tts")
+
+def render_crosstalk(spell_bytes, guest_voice_id, question, correct_answer, user_answer, member_name, tier):
+    """
+    生成完整相聲音檔
+    spell_bytes: 訪客唸咒語的錄音 (若 guest_voice_id 已存在則不會再複製)
+    回傳: (full_audio, guest_voice_id, timings)
+    timings: 各階段耗時 (秒)，鍵值為 crosstalk.clone / script / tts / merge / total
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    # --- 階段一：複製聲音 & 生成劇本 (平行) ---
+    def _clone():
+        with metrics.timer("crosstalk.clone", timings):
+            return audio.clone_guest_voice(spell_bytes)
+
+    def _script():
+        with metrics.timer("crosstalk.script", timings):
+            return brain.generate_crosstalk_script(question, correct_answer, user_answer, member_name)
+
+    clone_future = _stage_pool.submit(_clone) if not guest_voice_id and spell_bytes else None
+    script = _stage_pool.submit(_script).result()
+
+    # --- 階段二：逐句 TTS (有界併發) ---
+    with metrics.timer("crosstalk.tts", timings):
+        futures = [None] * len(script)
+
+        # member 台詞不需等待訪客聲音，先送出
+        for i, line in enumerate(script):
+            if line.get('speaker') != 'guest':
+                futures[i] = _tts_pool.submit(audio.generate_speech, line['text'], tier)
+
+        if clone_future:
+            guest_voice_id = clone_future.result()
+
+        for i, line in enumerate(script):
+            if futures[i] is None:
+                futures[i] = _tts_pool.submit(audio.generate_speech, line['text'], tier, specific_voice_id=guest_voice_id)
+
+        clips = [f.result() for f in futures]
+
+    # --- 階段三：依序合併 ---
+    with metrics.timer("crosstalk.merge", timings):
+        full_audio = audio.merge_dialogue(clips)
+
+    timings["crosstalk.total"] = time.perf_counter() - start
+    metrics.record("crosstalk.total", timings["crosstalk.total"])
+    return full_audio, guest_voice_id, timings
@@ -1,10 +1,15 @@
 import streamlit as st
 from supabase import create_client
-from openai import OpenAI
 import random
 import string
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from .auth import get_current_user_id
+from .cache import LRUCache
+from . import vector_index, state, transport
+from .log_writer import BufferedLogWriter
 
 # 1. 系統初始化
 @st.cache_resource
@@ -13,21 +18,57 @@ def init_supabase():
     key = st.secrets["SUPABASE_KEY"]
     return create_client(url, key)
 
-# 初始化 OpenAI (放在這裡確保全域可用)
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+@st.cache_resource
+def get_log_writer(_supabase):
+    """transaction_logs 批次寫入器 (整個行程共用一個)"""
+    return BufferedLogWriter(_supabase)
+
+# 初始化 OpenAI (放在這裡確保全域可用；全站共用一個連線池，見 transport.py)
+client = transport.openai_client()
 
 # ==========================================
 # 2. 使用者檔案與積分系統
 # ==========================================
 
-def get_user_profile(supabase, user_id=None):
+# --- 檔案快取 (每個 session 一份，TTL 內同一次渲染只讀一次資料庫) ---
+PROFILE_TTL = 10 # 秒
+
+def _profile_cache():
+    try: return st.session_state.setdefault("_profile_cache", {})
+    except: return {} # 不在 Streamlit 執行環境 (例如背景工作)，不快取
+
+def _cache_profile(user_id, profile):
+    _profile_cache()[user_id] = (time.time() + PROFILE_TTL, profile)
+
+def _patch_profile(user_id, **fields):
+    """寫入資料庫後同步更新快取 (write-through)"""
+    entry = _profile_cache().get(user_id)
+    if entry: entry[1].update(fields)
+
+def invalidate_profile(user_id):
+    _profile_cache().pop(user_id, None)
+
+def _versioned(cache_name, version_name, key, fetch, ttl=PROFILE_TTL):
+    """session 內記住讀取結果 (見 state.versioned)"""
+    return state.versioned(cache_name, version_name, key, fetch, ttl)
+
+def get_user_profile(supabase, user_id=None, fresh=False):
+    """
+    讀取使用者檔案 (TTL 快取)
+    fresh: 強制重新讀取資料庫
+    """
     if not user_id:
         user_id = get_current_user_id()
     if not user_id: return None
     
+    entry = _profile_cache().get(user_id)
+    if entry and not fresh and entry[0] > time.time():
+        return entry[1]
+    
     try:
         res = supabase.table("profiles").select("*").eq("user_id", user_id).execute()
         if res.data:
+            _cache_profile(user_id, res.data[0])
             return res.data[0]
         else:
             # 初始化新用戶
@@ -39,38 +80,62 @@ def get_user_profile(supabase, user_id=None):
                 "last_interaction_date": str(date.today())
             }
             supabase.table("profiles").insert(data).execute()
+            _cache_profile(user_id, data)
             return data
     except Exception as e:
         print(f"Profile Error: {e}")
         return {"xp": 0, "energy": 30, "tier": "basic"}
 
+# --- 已領取獎勵 (每個 session 載入一次，之後 O(1) 判斷) ---
+def _claimed_set(supabase, user_id):
+    try: cache = st.session_state.setdefault("_claimed_rewards", {})
+    except: cache = {}
+    if user_id not in cache:
+        res = supabase.table("claimed_rewards").select("reason").eq("user_id", user_id).execute()
+        cache[user_id] = {r['reason'] for r in res.data}
+    return cache[user_id]
+
 def has_user_claimed_reward(supabase, user_id, reason_key):
     """檢查是否已經領取過該獎勵"""
     try:
-        res = supabase.table("transaction_logs").select("id").eq("user_id", user_id).eq("reason", reason_key).execute()
-        return len(res.data) > 0
+        return reason_key in _claimed_set(supabase, user_id)
     except: return False
 
 def update_profile_stats(supabase, user_id, xp_delta=0, energy_delta=0, log_reason="", unique=False):
-    """更新 XP 或 電量"""
+    """
+    更新 XP 或 電量
+    透過資料庫函數 award_stats (sql/award_stats.sql) 原子完成：唯一檢查 + 加減分
+    transaction_logs 紀錄交給 log_writer 批次寫入
+    """
     if unique and has_user_claimed_reward(supabase, user_id, log_reason):
         return False
 
     try:
-        profile = get_user_profile(supabase, user_id)
-        new_xp = max(0, profile.get('xp', 0) + xp_delta)
-        new_energy = max(0, profile.get('energy', 30) + energy_delta)
-        
-        supabase.table("profiles").update({"xp": new_xp, "energy": new_energy}).eq("user_id", user_id).execute()
-        
+        res = supabase.rpc("award_stats", {
+            "p_user_id": user_id,
+            "p_xp_delta": xp_delta,
+            "p_energy_delta": energy_delta,
+            "p_reason": log_reason,
+            "p_unique": unique,
+            "p_log": False # 紀錄改走批次寫入
+        }).execute()
+        row = res.data[0] if res.data else None
+        if unique and row:
+            # 成功 = 剛領到；失敗 = 主鍵衝突 (別的請求先領了)，兩種都記成已領取
+            try: _claimed_set(supabase, user_id).add(log_reason)
+            except: pass
+        if not row or not row.get('applied'): return False
+        _patch_profile(user_id, xp=row['xp'], energy=row['energy'])
         if log_reason:
-            supabase.table("transaction_logs").insert({
+            get_log_writer(supabase).append({
                 "user_id": user_id, 
                 "amount": xp_delta if xp_delta != 0 else energy_delta, 
                 "reason": log_reason
-            }).execute()
+            })
         return True
-    except: return False
+    except Exception as e:
+        print(f"Award Error: {e}")
+        return False
 
 def reward_referrer(supabase, referrer_id, new_user_email):
     """
@@ -95,6 +160,7 @@ def upgrade_tier(supabase, user_id, new_tier, energy_bonus=0, xp_bonus=0):
     try:
         update_profile_stats(supabase, user_id, xp_delta=xp_bonus, energy_delta=energy_bonus, log_reason=f"升級 {new_tier}")
         supabase.table("profiles").update({"tier": new_tier}).eq("user_id", user_id).execute()
+        _patch_profile(user_id, tier=new_tier)
         return "success"
     except: return "error"
 
@@ -111,6 +177,7 @@ def check_daily_interaction(supabase, user_id):
             net_change = 1 - penalty
             update_profile_stats(supabase, user_id, energy_delta=net_change, log_reason=f"每日結算(缺席{penalty}天)")
             supabase.table("profiles").update({"last_interaction_date": str(today)}).eq("user_id", user_id).execute()
+            _patch_profile(user_id, last_interaction_date=str(today))
             return f"日安！今日能量 +1"
     except: return None
 
@@ -133,17 +200,65 @@ def get_feedbacks(supabase):
 # 3. 記憶與 RAG 系統
 # ==========================================
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 2048 # OpenAI 單次請求最多 2048 筆 input
+
+# 相同文字只嵌入一次 (key = sha256(model + text))
+_embedding_cache = LRUCache(max_items=5000)
+_embedding_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="embedding")
+
+def _embedding_key(text):
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+def _embed_batch(batch):
+    res = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+def get_embeddings(texts):
+    """
+    批次取得向量 (保持輸入順序)
+    先查快取，沒命中的去重後切成最大批次，平行送出
+    """
+    cleaned = [t.replace("\n", " ") for t in texts]
+    results = [None] * len(cleaned)
+    pending = {} # key -> (text, [indices])
+    for i, text in enumerate(cleaned):
+        key = _embedding_key(text)
+        hit = _embedding_cache.get(key)
+        if hit is not None:
+            results[i] = hit
+        else:
+            pending.setdefault(key, (text, []))[1].append(i)
+
+    if pending:
+        keys = list(pending)
+        batches = [keys[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(keys), EMBEDDING_BATCH_SIZE)]
+        futures = [_embedding_pool.submit(_embed_batch, [pending[k][0] for k in b]) for b in batches]
+        for batch, future in zip(batches, futures):
+            for key, vec in zip(batch, future.result()):
+                _embedding_cache.put(key, vec)
+                for i in pending[key][1]:
+                    results[i] = vec
+    return results
+
 def get_embedding(text):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
+    return get_embeddings([text])[0]
 
 def get_memories_by_role(supabase, role):
     user_id = get_current_user_id()
-    try:
-        res = supabase.table("memories").select("*").eq("user_id", user_id).eq("role", role).order('id', desc=True).execute()
-        return res.data
+    def fetch():
+        return supabase.table("memories").select("*").eq("user_id", user_id).eq("role", role).order('id', desc=True).execute().data
+    try: return _versioned("_memories", "memories", (user_id, role), fetch)
     except: return []
 
+def count_valid_memories(supabase, role):
+    """計算有效回憶數 (排除「已略過」)，只取筆數不取內容"""
+    user_id = get_current_user_id()
+    try:
+        res = supabase.table("memories").select("id", count="exact").eq("user_id", user_id).eq("role", role).not_.like("content", "%(已略過)%").execute()
+        return res.count or 0
+    except: return 0
+
 def get_all_memories_text(supabase, role):
     user_id = get_current_user_id()
     try:
@@ -152,25 +267,44 @@ def get_all_memories_text(supabase, role):
     except: return ""
 
 def save_memory_fragment(supabase, role, question, answer):
+    return save_memory_fragments(supabase, role, [(question, answer)])
+
+def save_memory_fragments(supabase, role, qa_pairs):
+    """
+    批次存入回憶 [(question, answer), ...]
+    同一題的舊回答會先刪除；向量一次批次取得，資料一次寫入
+    """
     user_id = get_current_user_id()
-    if not user_id: return False
-    full_content = f"【關於{question}】：{answer}"
+    if not user_id or not qa_pairs: return False
+    contents = [f"【關於{q}】：{a}" for q, a in qa_pairs]
+    prefixes = tuple(f"【關於{q}】" for q, _ in qa_pairs)
     try:
         existing = get_memories_by_role(supabase, role)
-        for mem in existing:
-            if mem['content'].startswith(f"【關於{question}】"):
-                supabase.table("memories").delete().eq("id", mem['id']).execute()
+        stale = [mem['id'] for mem in existing if mem['content'].startswith(prefixes)]
+        if stale:
+            supabase.table("memories").delete().in_("id", stale).execute()
+            vector_index.on_deleted(user_id, role, stale)
     except: pass
-    embedding = get_embedding(full_content)
-    data = {"user_id": user_id, "role": role, "content": full_content, "embedding": embedding}
-    supabase.table("memories").insert(data).execute()
+    embeddings = get_embeddings(contents)
+    rows = [
+        {"user_id": user_id, "role": role, "content": c, "embedding": e}
+        for c, e in zip(contents, embeddings)
+    ]
+    res = supabase.table("memories").insert(rows).execute()
+    vector_index.on_inserted(user_id, role, res.data or [])
+    state.bump_version("memories")
     return True
 
 def search_relevant_memories(supabase, role, query_text):
     try:
         query_vec = get_embedding(query_text)
-        res = supabase.rpc("match_memories", {"query_embedding": query_vec, "match_threshold": 0.5, "match_count": 3, "search_role": role}).execute()
-        return "\n".join([item['content'] for item in res.data])
+        # 選配：本機向量索引 (省下 RPC 來回)
+        user_id = get_current_user_id()
+        if user_id and vector_index.is_enabled():
+            matches = vector_index.get_index(supabase, user_id, role).search(query_vec)
+        else:
+            matches = supabase.rpc("match_memories", {"query_embedding": query_vec, "match_threshold": vector_index.MATCH_THRESHOLD, "match_count": vector_index.MATCH_COUNT, "search_role": role}).execute().data
+        return "\n".join([item['content'] for item in matches])
     except: return ""
 
 # ==========================================
@@ -187,13 +321,15 @@ def save_persona_summary(supabase, role, content, member_nickname=None):
         if res.data: supabase.table("personas").update(data).eq("id", res.data[0]['id']).execute()
         else: supabase.table("personas").insert(data).execute()
     except: pass
+    state.bump_version("personas")
 
 def load_persona(supabase, role):
     target_id = get_current_user_id()
     if not target_id: return None
-    try:
+    def fetch():
         res = supabase.table("personas").select("content, member_nickname").eq("user_id", target_id).eq("role", role).execute()
         return res.data[0] if res.data else None
+    try: return _versioned("_personas", "personas", (target_id, role), fetch)
     except: return None
 
 def create_share_token(supabase, role):
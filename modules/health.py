@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+
+# ==========================================
+# 上游服務健康狀態 + 斷路器 (LLM / TTS 共用)
+# ==========================================
+# closed   : 正常
+# open     : 連續失敗或錯誤率過高，冷卻期間直接跳過
+# half_open: 冷卻結束，放一個請求試水溫，成功就恢復
+
+class ProviderHealth:
+    def __init__(self, name, window=50, failure_threshold=5, error_rate_threshold=0.5, min_samples=10, cooldown=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._samples = deque(maxlen=window) # (latency, ok)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._blocked_until = 0.0 # 額度用完 (429) 時的封鎖期限
+
+    # --- 狀態 ---
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None: return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown: return "half_open"
+        return "open"
+
+    @property
+    def available(self):
+        """斷路器未打開且不在額度封鎖期 (不佔用 half_open 的試水溫名額)"""
+        with self._lock:
+            return time.monotonic() >= self._blocked_until and self._state() != "open"
+
+    def allow(self):
+        """這次可以送請求嗎？ (half_open 一次只放一個)"""
+        with self._lock:
+            if time.monotonic() < self._blocked_until: return False
+            state = self._state()
+            if state == "closed": return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    # --- 回報結果 ---
+    def record_success(self, latency):
+        with self._lock:
+            if self._opened_at is not None: self._samples.clear() # 恢復後重新累計錯誤率
+            self._samples.append((latency, True))
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, latency=None):
+        with self._lock:
+            self._samples.append((latency, False))
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._consecutive_failures >= self.failure_threshold or (
+                len(self._samples) >= self.min_samples and self._error_rate() >= self.error_rate_threshold
+            ):
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """這次請求不計成敗 (呼叫端的錯、被放棄、暫時忙碌)，只歸還 half_open 的試水溫名額"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def block_for(self, seconds):
+        """額度/速率限制 (HTTP 429)：期限內不再送請求，但不算故障、不影響斷路器"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._trial_in_flight = False
+
+    # --- 統計 ---
+    def _error_rate(self):
+        if not self._samples: return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def latency_percentile(self, pct):
+        with self._lock:
+            lat = sorted(l for l, ok in self._samples if ok and l is not None)
+        if not lat: return None
+        return lat[min(len(lat) - 1, int(round(pct / 100 * (len(lat) - 1))))]
+
+    def snapshot(self):
+        with self._lock:
+            info = {
+                "state": self._state(), "error_rate": self._error_rate(), "samples": len(self._samples),
+                "blocked_for": max(0.0, self._blocked_until - time.monotonic())
+            }
+        info["p50"] = self.latency_percentile(50)
+        info["p90"] = self.latency_percentile(90)
+        return info
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def get(name):
+    """取得 (或建立) 某個上游的健康狀態，整個行程共用"""
+    with _registry_lock:
+        if name not in _registry: _registry[name] = ProviderHealth(name)
+        return _registry[name]
+
+def snapshot():
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: h.snapshot() for name, h in items}
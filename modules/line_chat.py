@@ -0,0 +1,176 @@
+import heapq
+import io
+import random
+import re
+from collections import namedtuple
+
+# ==========================================
+# LINE 對話紀錄 (.txt) 串流解析
+# ==========================================
+# 匯出格式：
+#   [LINE] 與小明的聊天記錄
+#   儲存日期：2024/01/01 12:00
+#
+#   2023/12/31（日）
+#   上午10:15	爸爸	早安
+#   下午03:20	小明	[貼圖]
+#   22:01	爸爸	"第一行
+#   第二行"
+#
+# 一行一行讀，不把整個檔案載入記憶體 (100 MB 的匯出檔也只佔一則訊息的空間)
+
+Message = namedtuple("Message", "date time sender text") # date: YYYY-MM-DD，time: HH:MM (24 小時制)
+
+_DATE_RE = re.compile(r"^(\d{4})[/.\-](\d{1,2})[/.\-](\d{1,2})(?:\s*[（(]?\s*\S{1,3}\s*[）)]?)?\s*$")
+_DATE_EN_RE = re.compile(r"^[A-Za-z]{3},\s*(\d{1,2})/(\d{1,2})/(\d{4})\s*$") # 英文介面：Sun, 12/31/2023
+_TIME_RE = re.compile(r"^(上午|下午|AM|PM)?\s*(\d{1,2}):(\d{2})\s*(AM|PM)?$", re.IGNORECASE)
+
+# 非文字內容 / 系統訊息 (摘要時略過)
+MEDIA_TOKENS = ("[貼圖]", "[照片]", "[影片]", "[檔案]", "[語音訊息]", "[位置資訊]", "[聯絡資訊]", "[相簿]", "[記事本]",
+                "[Sticker]", "[Photo]", "[Video]", "[File]", "[Voice message]")
+NOISE_PATTERN = r"(?:已收回訊息|unsent a message|☎|通話時間|未接來電|取消通話|Missed call|https?://\S+)"
+_NOISE_RE = re.compile(NOISE_PATTERN)
+
+def _parse_time(text):
+    m = _TIME_RE.match(text.strip())
+    if not m: return None
+    hour, minute = int(m.group(2)), int(m.group(3))
+    meridiem = (m.group(1) or m.group(4) or "").upper()
+    if meridiem in ("下午", "PM") and hour < 12: hour += 12
+    if meridiem in ("上午", "AM") and hour == 12: hour = 0
+    return f"{hour:02d}:{minute:02d}"
+
+def _parse_date(line):
+    m = _DATE_RE.match(line)
+    if m: return f"{int(m.group(1)):04d}-{int(m.group(2)):02d}-{int(m.group(3)):02d}"
+    m = _DATE_EN_RE.match(line)
+    if m: return f"{int(m.group(3)):04d}-{int(m.group(1)):02d}-{int(m.group(2)):02d}"
+    return None
+
+class _LineReader(io.TextIOWrapper):
+    """用完只解除包裝、不關閉底層檔案 (同一份上傳可以再讀一次)"""
+    def close(self):
+        if getattr(self, "_released", False): return
+        self._released = True
+        self.detach()
+
+def read_lines(up_file, encoding="utf-8-sig"):
+    """把 file_uploader 的檔案物件 (或 bytes) 包成逐行讀取的文字串流 (每次都從頭讀)"""
+    if isinstance(up_file, (bytes, bytearray)): up_file = io.BytesIO(up_file)
+    up_file.seek(0)
+    return _LineReader(up_file, encoding=encoding, errors="replace", newline=None)
+
+def _finish(msg):
+    text = msg.text
+    if len(text) >= 2 and text.startswith('"') and text.endswith('"') and "\n" in text:
+        text = text[1:-1] # 多行訊息外面包的引號
+    return msg._replace(text=text.strip())
+
+def _in_quote(msg):
+    """多行訊息的引號還沒閉合 (LINE 會把內文的引號寫成 ""，所以看引號數是不是奇數)"""
+    return msg is not None and msg.text.startswith('"') and msg.text.count('"') % 2 == 1
+
+def iter_messages(lines):
+    """
+    逐則產生 Message (所有人的訊息都會產生；系統訊息 sender 為 None)
+    沒有時間欄位的行視為上一則訊息的續行
+    引號還沒閉合時遇到像日期的行，先暫存，看下一個非空行：
+    是有時間的訊息 -> 真的換日了 (開頭的引號只是單行訊息的一部分，例如「"好啦 我知道」)；否則是引號內的續行
+    """
+    date, pending, held = None, None, [] # held: 引號內遇到的日期行 (與其後的空行)
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if held and not line.strip():
+            held.append(line)
+            continue
+        parts = line.split("\t")
+        time = _parse_time(parts[0]) if len(parts) >= 2 else None
+        if held:
+            if time:
+                yield _finish(pending)
+                date, pending = _parse_date(held[0].strip()), None
+            else:
+                pending = pending._replace(text="\n".join([pending.text] + held))
+            held = []
+        if time:
+            if pending: yield _finish(pending)
+            if len(parts) >= 3: pending = Message(date, time, parts[1].strip(), "\t".join(parts[2:]))
+            else: pending = Message(date, time, None, parts[1])
+            continue
+        new_date = _parse_date(line.strip()) if line and not line[0].isspace() else None
+        if new_date:
+            if _in_quote(pending):
+                held = [line]
+                continue
+            if pending: yield _finish(pending)
+            date, pending = new_date, None
+            continue
+        if pending: pending = pending._replace(text=pending.text + "\n" + line)
+    if pending: yield _finish(pending)
+
+def is_text(msg):
+    """排除貼圖、照片、收回訊息、通話紀錄、連結等非文字內容"""
+    text = msg.text
+    if not text or text in MEDIA_TOKENS: return False
+    return not _NOISE_RE.search(text)
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字約一字一 token，其他字元約四個一 token"""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+# --- 摘要 (token 預算內的代表性抽樣) ---
+DIGEST_TOKEN_BUDGET = 6000
+MAX_UTTERANCE_CHARS = 120 # 單則過長就截斷，避免一則訊息吃掉預算
+RESERVOIR_SIZE = 4000 # 抽樣池大小 (遠大於預算可放的則數，記憶體固定)
+
+class DigestSampler:
+    """
+    build_digest 的逐則版本：add() 一則一則餵，result() 取摘要
+    (可以和其他統計共用同一次掃描，不必為了摘要再讀一遍檔案)
+    """
+    def __init__(self, budget_tokens=DIGEST_TOKEN_BUDGET, seed=0):
+        self.budget_tokens = budget_tokens
+        self._rng = random.Random(seed)
+        self._heap, self._seen, self.total, self.first, self.last = [], 0, 0, None, None
+
+    def add(self, msg):
+        idx, self._seen = self._seen, self._seen + 1
+        if not is_text(msg): return
+        self.total += 1
+        self.first = self.first or msg.date
+        self.last = msg.date or self.last
+        item = (self._rng.random(), idx, msg)
+        if len(self._heap) < RESERVOIR_SIZE: heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]: heapq.heapreplace(self._heap, item)
+
+    def result(self):
+        # key 由大到小依序放入，直到預算用完 (等同從抽樣池再隨機取一個子集)
+        chosen, dates, used = [], set(), 0
+        for _, idx, msg in sorted(self._heap, reverse=True):
+            text = " ".join(msg.text.split())[:MAX_UTTERANCE_CHARS]
+            cost = estimate_tokens(text) + 1
+            if msg.date not in dates: cost += 6 # 日期標題行
+            if used + cost > self.budget_tokens: continue
+            chosen.append((idx, msg.date, text))
+            dates.add(msg.date)
+            used += cost
+
+        lines, current = [], object()
+        for _, date, text in sorted(chosen):
+            if date != current:
+                lines.append(f"# {date or '未知日期'}")
+                current = date
+            lines.append(text)
+        return "\n".join(lines), {"messages": self.total, "sampled": len(chosen), "first": self.first, "last": self.last}
+
+def build_digest(messages, budget_tokens=DIGEST_TOKEN_BUDGET, seed=0):
+    """
+    從整段歷史均勻抽樣主角的話，依日期排序輸出，總長度在 budget_tokens 內
+    用優先權抽樣 (每則給一個隨機 key，保留 key 最大的 RESERVOIR_SIZE 則)：
+    只掃一遍、記憶體固定，早年與近期的對話被抽到的機率相同
+    回傳: (digest 文字, {"messages": 主角總則數, "sampled": 放進摘要的則數, "first": 最早日期, "last": 最晚日期})
+    """
+    sampler = DigestSampler(budget_tokens, seed)
+    for msg in messages: sampler.add(msg)
+    return sampler.result()
@@ -0,0 +1,82 @@
+import atexit
+import threading
+import time
+from modules import metrics
+
+# ==========================================
+# transaction_logs 緩衝批次寫入器
+# ==========================================
+# 紀錄先放記憶體，累積到 max_batch 筆或超過 max_delay 秒就一次 bulk insert
+# 寫入失敗以指數退避重試；行程結束前 (atexit) 會把剩下的全部寫出
+
+class BufferedLogWriter:
+    def __init__(self, supabase, table="transaction_logs", max_batch=50, max_delay=5.0, max_retries=4, max_buffer=5000):
+        self.supabase = supabase
+        self.table = table
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.max_buffer = max_buffer # 資料庫長時間掛掉時的上限，超過就丟最舊的
+        self._buf = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._oldest = None
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, entry):
+        with self._lock:
+            if not self._buf: self._oldest = time.monotonic()
+            self._buf.append(entry)
+            full = len(self._buf) >= self.max_batch
+        if full: self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(timeout=self.max_delay)
+            self._wake.clear()
+            with self._lock:
+                due = self._buf and (
+                    len(self._buf) >= self.max_batch or
+                    time.monotonic() - self._oldest >= self.max_delay
+                )
+            if due: self.flush()
+
+    def flush(self):
+        """把緩衝區全部寫出 (失敗的會放回緩衝區，等下一輪)"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buf = self._buf, []
+                self._oldest = None
+            if not batch: return True
+
+            delay = 0.5
+            for attempt in range(self.max_retries):
+                try:
+                    self.supabase.table(self.table).insert(batch).execute()
+                    metrics.incr("log_writer.flushes")
+                    metrics.incr("log_writer.rows", len(batch))
+                    return True
+                except Exception as e:
+                    print(f"Log Writer Error (try {attempt + 1}): {e}")
+                    if attempt + 1 < self.max_retries: time.sleep(delay)
+                    delay *= 2
+
+            metrics.incr("log_writer.failed_flushes")
+            with self._lock:
+                self._buf = (batch + self._buf)[-self.max_buffer:]
+                self._oldest = time.monotonic()
+            return False
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buf)
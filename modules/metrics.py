@@ -0,0 +1,63 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================
+# 輕量級效能指標 (行程內共用)
+# ==========================================
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_MAX_SAMPLES = 200 # 每個指標最多保留的樣本數
+
+def incr(name, amount=1):
+    """計數器 +amount"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def record(name, value):
+    """記錄一筆耗時樣本 (秒)"""
+    with _lock:
+        samples = _timings.setdefault(name, [])
+        samples.append(value)
+        if len(samples) > _MAX_SAMPLES:
+            del samples[0]
+
+@contextmanager
+def timer(name, sink=None):
+    """
+    計時區塊
+    sink: 若有傳入 dict，會同時把耗時寫進去 (方便單次請求回報各階段耗時)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        record(name, elapsed)
+        if sink is not None: sink[name] = elapsed
+
+def percentile(name, pct):
+    """回傳某指標的百分位數 (無樣本則回傳 None)"""
+    with _lock:
+        samples = sorted(_timings.get(name, []))
+    if not samples: return None
+    idx = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[idx]
+
+def snapshot():
+    """目前所有指標 (給後台或除錯用)"""
+    with _lock:
+        timings = {k: list(v) for k, v in _timings.items()}
+        counters = dict(_counters)
+    summary = {}
+    for name, samples in timings.items():
+        ordered = sorted(samples)
+        summary[name] = {
+            "count": len(ordered),
+            "avg": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "max": ordered[-1],
+        }
+    return {"counters": counters, "timings": summary}
@@ -0,0 +1,83 @@
+import io
+import time
+import tracemalloc
+import numpy as np
+from pydub import AudioSegment
+from modules import mp3
+
+# ==========================================
+# NumPy PCM 混音引擎 (需要解碼時使用)
+# ==========================================
+# 依 MP3 frame 數估出總長度，預先配置一個 int16 緩衝區 -> 一段一段解碼、填入後就丟掉
+# (記憶體峰值約 = 整段輸出 + 一段解碼中的音訊；估不準時才擴充緩衝區)
+# 間隔靜音就是留白 (np.zeros)，最後只編碼一次
+# 取代 `combined += seg + silence` 每圈都重建整段緩衝的寫法
+
+def _decode(clip, frame_rate, channels):
+    seg = AudioSegment.from_file(io.BytesIO(clip))
+    if seg.frame_rate != frame_rate: seg = seg.set_frame_rate(frame_rate)
+    if seg.channels != channels: seg = seg.set_channels(channels)
+    if seg.sample_width != 2: seg = seg.set_sample_width(2)
+    return np.frombuffer(seg.raw_data, dtype=np.int16)
+
+def _estimate_samples(clip, frame_rate, channels):
+    """不解碼估算樣本數 (MP3 數 frame)；非 MP3 回傳 0，之後邊填邊擴充"""
+    ms = mp3.duration_ms(clip)
+    return int(frame_rate * ms / 1000) * channels if ms else 0
+
+def _grow(buf, needed):
+    bigger = np.zeros(max(needed, len(buf) + len(buf) // 4), dtype=np.int16)
+    bigger[:len(buf)] = buf
+    return bigger
+
+def mix(clips, gap_ms, trailing_gap=False, frame_rate=44100, channels=1, bitrate="128k"):
+    """
+    依序串接多段音訊，中間留 gap_ms 靜音，輸出 MP3 bytes
+    trailing_gap: 最後一段後面也補靜音
+    輸出格式固定為 frame_rate / channels / bitrate，與舊的 pydub `+` 寫法不同：
+    - 預設單聲道 44.1kHz (舊寫法跟著輸入裡最多的聲道、最高的取樣率走)；TTS 與入庫錄音本來就是單聲道，
+      若有立體聲輸入會被混成單聲道，需要保留請傳 channels=2
+    - 128k 與舊寫法 (ffmpeg libmp3lame 預設) 相同，只是改成明確指定
+    """
+    clips = [c for c in clips if c]
+    if not clips: return None
+
+    gap = int(frame_rate * gap_ms / 1000) * channels
+    n_gaps = len(clips) if trailing_gap else len(clips) - 1
+    buf = np.zeros(sum(_estimate_samples(c, frame_rate, channels) for c in clips) + gap * n_gaps, dtype=np.int16)
+
+    pos = 0
+    for i, clip in enumerate(clips):
+        samples = _decode(clip, frame_rate, channels) # 一次只解碼一段，填完就釋放
+        end = pos + len(samples) + (gap if i < n_gaps else 0)
+        if end > len(buf): buf = _grow(buf, end)
+        buf[pos:pos + len(samples)] = samples
+        pos = end
+        del samples
+
+    out = AudioSegment(data=buf[:pos].tobytes(), sample_width=2, frame_rate=frame_rate, channels=channels)
+    buffer = io.BytesIO()
+    out.export(buffer, format="mp3", bitrate=bitrate)
+    return buffer.getvalue()
+
+def profile(fn, *args, **kwargs):
+    """
+    量測一次合併的峰值記憶體與 CPU
+    回傳: (結果, {"wall": 秒, "cpu": 本行程秒, "cpu_ffmpeg": 子行程秒, "peak_mb": MB})
+    """
+    import resource # 只有 Unix 有，僅量測時需要
+    tracemalloc.start()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu, wall = time.process_time(), time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return result, {
+        "wall": time.perf_counter() - wall,
+        "cpu": time.process_time() - cpu,
+        "cpu_ffmpeg": (after.ru_utime + after.ru_stime) - (children.ru_utime + children.ru_stime),
+        "peak_mb": peak / 1024 / 1024,
+    }
@@ -0,0 +1,136 @@
+# ==========================================
+# MP3 frame 層級拼接 (不經 ffmpeg 解碼/重新編碼)
+# ==========================================
+# 同一個 TTS 引擎產出的 MP3 取樣率、聲道都相同，frame 可以直接首尾相接
+# 間隔用「全零 side info」的靜音 frame 填充 (part2_3_length = 0 -> 解出來就是靜音)
+# 格式不一致或解析失敗回傳 None，由呼叫端改走解碼路徑
+
+# Layer III bitrate 表 (kbps)
+_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    25: [11025, 12000, 8000],
+}
+_VERSION_BITS = {3: 1, 2: 2, 0: 25} # 1 = reserved
+
+def _skip_id3(data):
+    """略過開頭的 ID3v2 標籤，回傳第一個 frame 的位置"""
+    pos = 0
+    while data[pos:pos + 3] == b"ID3" and len(data) >= pos + 10:
+        size = (data[pos + 6] << 21) | (data[pos + 7] << 14) | (data[pos + 8] << 7) | data[pos + 9]
+        footer = 10 if data[pos + 5] & 0x10 else 0
+        pos += 10 + size + footer
+    return pos
+
+def parse_header(data, pos):
+    """
+    解析 frame header，非 Layer III 或無效回傳 None
+    回傳 dict: version, sample_rate, mode, bitrate, length, samples
+    """
+    if pos + 4 > len(data): return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0: return None
+    version = _VERSION_BITS.get((b1 >> 3) & 3)
+    if version is None or ((b1 >> 1) & 3) != 1: return None # 只處理 Layer III
+    br_idx, sr_idx = b2 >> 4, (b2 >> 2) & 3
+    if br_idx in (0, 15) or sr_idx == 3: return None
+    bitrate = _BITRATES[1 if version == 1 else 2][br_idx]
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b2 >> 1) & 1
+    coef = 144 if version == 1 else 72
+    return {
+        "version": version,
+        "sample_rate": sample_rate,
+        "mode": b3 >> 6, # 3 = mono
+        "protected": not (b1 & 1),
+        "bitrate": bitrate,
+        "length": coef * bitrate * 1000 // sample_rate + padding,
+        "samples": 1152 if version == 1 else 576,
+    }
+
+def _side_info_size(h):
+    mono = h["mode"] == 3
+    if h["version"] == 1: return 17 if mono else 32
+    return 9 if mono else 17
+
+def _is_info_frame(data, pos, h):
+    """Xing / Info / VBRI 標頭 frame (記錄的是原檔總長，拼接後會誤導播放器，要拿掉)"""
+    start = pos + 4 + (2 if h["protected"] else 0) + _side_info_size(h)
+    if data[start:start + 4] in (b"Xing", b"Info"): return True
+    return data[pos + 36:pos + 40] == b"VBRI"
+
+def scan_frames(data):
+    """
+    掃描所有音訊 frame
+    回傳 (格式, [(offset, length), ...])；不是乾淨的 Layer III 串流回傳 None
+    格式 = (version, sample_rate, 是否單聲道)
+    """
+    data = memoryview(data)
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b"TAG": end -= 128 # ID3v1
+    pos = _skip_id3(data)
+    frames, fmt = [], None
+    while pos + 4 <= end:
+        h = parse_header(data, pos)
+        if not h or pos + h["length"] > end: break
+        this_fmt = (h["version"], h["sample_rate"], h["mode"] == 3)
+        if fmt is None: fmt = this_fmt
+        elif this_fmt != fmt: return None
+        if frames or not _is_info_frame(data, pos, h):
+            frames.append((pos, h["length"]))
+        pos += h["length"]
+    # 尾端只允許少量殘渣 (截斷的最後一個 frame)
+    if not frames or end - pos > 2048: return None
+    return fmt, frames
+
+def silence_frame(fmt):
+    """產生一個與 fmt 相容的靜音 frame (最低 bitrate、無 CRC、side info 全零)"""
+    version, sample_rate, mono = fmt
+    version_bits = {1: 3, 2: 2, 25: 0}[version]
+    sr_idx = _SAMPLE_RATES[version].index(sample_rate)
+    b1 = 0xE0 | (version_bits << 3) | (1 << 1) | 1 # Layer III, 無 CRC
+    b2 = (1 << 4) | (sr_idx << 2) # bitrate index 1，無 padding
+    b3 = (3 << 6) if mono else (1 << 6) # 單聲道 / joint stereo
+    header = bytes([0xFF, b1, b2, b3])
+    h = parse_header(header, 0)
+    return header + bytes(h["length"] - 4)
+
+def samples_per_frame(fmt):
+    return 1152 if fmt[0] == 1 else 576
+
+def splice(clips, gap_ms, trailing_gap=False):
+    """
+    直接串接多段 MP3 的 frame，中間插入 gap_ms 的靜音
+    trailing_gap: 最後一段後面也補靜音 (與舊版 merge_dialogue 行為一致)
+    任何一段格式不同就回傳 None
+    """
+    scanned = []
+    for clip in clips:
+        if not clip: continue
+        result = scan_frames(clip)
+        if not result: return None
+        scanned.append((memoryview(clip), result))
+    if not scanned: return None
+
+    fmt = scanned[0][1][0]
+    if any(s[1][0] != fmt for s in scanned): return None
+
+    n_silence = round(gap_ms / 1000 * fmt[1] / samples_per_frame(fmt))
+    gap = silence_frame(fmt) * n_silence
+
+    parts = []
+    for i, (view, (_, frames)) in enumerate(scanned):
+        parts += [view[o:o + n] for o, n in frames]
+        if i < len(scanned) - 1 or trailing_gap: parts.append(gap)
+    return b"".join(parts)
+
+def duration_ms(data):
+    """估算 MP3 長度 (frame 數 x 每 frame 樣本數)，無法解析回傳 None"""
+    result = scan_frames(data)
+    if not result: return None
+    fmt, frames = result
+    return int(len(frames) * samples_per_frame(fmt) * 1000 / fmt[1])
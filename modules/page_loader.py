@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from modules import metrics
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError: # 舊版 Streamlit
+    add_script_run_ctx = get_script_run_ctx = None
+
+# ==========================================
+# 頁面資料載入器 (一次渲染需要的資料同時抓)
+# ==========================================
+# 先宣告需要哪些資料，彼此獨立的查詢丟到執行緒池並行
+# 總延遲 = 最慢的那一個，而不是全部相加
+# 工作執行緒會帶上目前 session 的 ScriptRunContext，所以 get_current_user_id / session 快取照常可用
+#
+#   loader = PageLoader("member")
+#   loader.add("profile", database.get_user_profile, supabase, default={})
+#   page = loader.load()
+#   page["profile"], page.timings["page.member.profile"]
+
+MAX_WORKERS = 8
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="page-load")
+
+class PageData(dict):
+    """載入結果：dict 本體是資料；timings 為各項耗時 (秒，key 同 metrics 名稱)，errors 為失敗的項目"""
+    def __init__(self):
+        super().__init__()
+        self.timings = {}
+        self.errors = {}
+
+class PageLoader:
+    def __init__(self, name, timeout=15.0):
+        self.name = name
+        self.timeout = timeout # 整頁最多等多久，逾時的項目用 default
+        self._fetches = []
+
+    def add(self, key, fn, *args, default=None, **kwargs):
+        """宣告一項資料；失敗或逾時時回傳 default"""
+        self._fetches.append((key, fn, args, kwargs, default))
+        return self
+
+    def _run(self, ctx, key, fn, args, kwargs, sink):
+        if ctx is not None: add_script_run_ctx(threading.current_thread(), ctx)
+        with metrics.timer(f"page.{self.name}.{key}", sink=sink):
+            return fn(*args, **kwargs)
+
+    def load(self):
+        page = PageData()
+        ctx = get_script_run_ctx() if get_script_run_ctx else None
+
+        with metrics.timer(f"page.{self.name}.total", sink=page.timings):
+            futures = {key: (_pool.submit(self._run, ctx, key, fn, args, kwargs, page.timings), default)
+                       for key, fn, args, kwargs, default in self._fetches}
+            wait([f for f, _ in futures.values()], timeout=self.timeout)
+
+        for key, (future, default) in futures.items():
+            if not future.done():
+                page.errors[key] = "timeout"
+                page[key] = default
+                continue
+            try:
+                page[key] = future.result()
+            except Exception as e:
+                print(f"Page Load Error ({self.name}.{key}): {e}")
+                page.errors[key] = str(e)
+                page[key] = default
+        return page
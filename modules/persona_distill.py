@@ -0,0 +1,212 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules import brain, line_chat, metrics, style_stats
+from modules.cache import LRUCache
+
+# ==========================================
+# 人設蒸餾 (map-reduce，讀完整段歷史)
+# ==========================================
+# map   : 對話依日期切成 token 上限內的段落，便宜模型平行萃取「說話風格 + 往事」
+# reduce: 把各段筆記 + 一小段原句抽樣交給 GPT-4o，產出 system_prompt / flashback
+# 段落結果以內容 hash 快取：重新上傳 (通常只多了最近幾天) 只需要重算有變動的段落
+# 上傳檔只掃一遍：分段、本機說話習慣統計 (style_stats)、reduce 用的原句抽樣在同一次掃描完成
+
+MAP_VERSION = "v1" # map prompt 有改就換版本，舊快取自動失效
+CHUNK_TOKENS = 6000 # 每段上限
+MAX_CHUNKS = 40 # 段數上限；超過時每個日曆區間挑一段 (一定包含最近一段，見 _select)
+BUCKET_MONTHS = (1, 2, 3, 6, 12, 24, 60) # 段數超過上限時依序試用的區間長度 (月)，取第一個放得下的
+MAP_CONCURRENCY = 4
+MAP_MODELS = ("gpt-4o-mini", "gemini-1.5-flash")
+REDUCE_SAMPLE_TOKENS = 1500 # reduce 時附上的原句抽樣 (讓 GPT-4o 看到真實語氣)
+
+_notes = LRUCache(max_items=2000) # key -> 段落筆記 dict
+_pool = ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix="persona-map")
+
+MAP_PROMPT = """
+以下是一段 LINE 對話紀錄 (「# 日期」為當天的開始，每行是「說話者: 內容」)。
+主角是「{member_name}」。請只分析主角，回傳 JSON：
+{{
+    "style": ["主角說話風格的觀察，例如語氣、斷句、常用詞 (最多 5 點)"],
+    "catchphrases": ["主角的口頭禪或常用語氣助詞 (原文，最多 8 個)"],
+    "episodes": ["這段期間具體、溫馨或有趣的往事 (誰、何時、做了什麼，每則 40 字內，最多 3 則)"]
+}}
+
+對話：
+{chunk}
+"""
+
+REDUCE_PROMPT = """
+分析以下從 LINE 對話紀錄整理出的資料。
+
+【角色定義】：
+- 主角 (我)：{member_name}
+- 對話對象：{target_role}
+
+【任務目標】：
+1. **語氣分析**：深度模仿【主角】的說話風格（口頭禪、語氣助詞、斷句習慣）。
+2. **稱呼規範**：在生成的對話中，請一律使用「我」自稱，並用「你」稱呼對方。**絕對不要**在句子中加入對方的名字或暱稱（因為系統會在語音開頭自動拼接真實呼喚）。
+3. **回憶提取**：請從往事清單中挑一段最具體、溫馨或有趣的「往事」（例如一起去過哪裡、吃過什麼、發生的小意外）。
+
+【輸出格式 (JSON)】：
+請直接回傳以下 JSON 格式，不要有其他文字：
+{{
+    "system_prompt": "你現在扮演... (請填入完整的人設指令)",
+    "flashback": "還記得那天..." (請填入提取出的往事，用口語表達，約 30-50 字)
+}}
+
+【各時期的風格筆記】：
+{style}
+
+【常見口頭禪】：
+{catchphrases}
+
+【往事清單 (依時間排序)】：
+{episodes}
+
+【主角原句抽樣 ({first} ~ {last})】：
+{sample}
+"""
+
+def _day_blocks(messages, max_tokens):
+    """逐日產生 (日期, 行列表, token 數)；單日超過上限就在日內再切"""
+    date, block, used = None, [], 0
+    for msg in messages:
+        if not msg.sender or not line_chat.is_text(msg): continue
+        text = f"{msg.sender}: {' '.join(msg.text.split())[:line_chat.MAX_UTTERANCE_CHARS]}"
+        cost = line_chat.estimate_tokens(text) + 1
+        if block and (msg.date != date or used + cost > max_tokens):
+            yield date, block, used
+            block, used = [], 0
+        if not block:
+            date = msg.date
+            block, used = [f"# {date or '未知日期'}"], 6
+        block.append(text)
+        used += cost
+    if block: yield date, block, used
+
+def iter_chunks(messages, max_tokens=CHUNK_TOKENS):
+    """
+    以「天」為單位累積成段，超過上限就切段
+    只在日期邊界切：新增的對話只會影響最後幾段，前面段落的 hash 不變
+    產生: (段落文字, 開始日期, 結束日期)
+    """
+    lines, used, first, last = [], 0, None, None
+    for date, block, cost in _day_blocks(messages, max_tokens):
+        if lines and used + cost > max_tokens:
+            yield "\n".join(lines), first, last
+            lines, used, first = [], 0, None
+        lines.extend(block)
+        used += cost
+        first, last = first or date, date
+    if lines: yield "\n".join(lines), first, last
+
+def _member_chunks(messages, member_name):
+    """只留主角有開口的段落"""
+    mark = f"\n{member_name}: "
+    return (c for c in iter_chunks(messages) if mark in c[0])
+
+def _month(date):
+    """YYYY-MM-DD -> 月份序號 (日期不明為 -1)"""
+    if not date: return -1
+    return int(date[:4]) * 12 + int(date[5:7]) - 1
+
+def _select(chunks, limit=MAX_CHUNKS):
+    """
+    邊讀邊挑段：總段數在 limit 內全部保留；超過時每個日曆區間 (月 / 季 / 年...) 取第一段，再加上最近一段
+    區間對齊日曆、且只看開始日期，歷史變長時前面挑中的段落不會換掉 (段落 hash 快取才命中得了)
+    記憶體只放 limit 段 + 每月第一段
+    回傳: ([(index, 段落, 開始日期, 結束日期), ...], 總段數)
+    """
+    kept, firsts, latest, total = [], {}, None, 0
+    for i, (chunk, first, last) in enumerate(chunks):
+        item = (i, chunk, first, last)
+        total += 1
+        if kept is not None:
+            kept.append(item)
+            if len(kept) > limit: kept = None
+        firsts.setdefault(_month(first), item)
+        latest = item
+    if kept is not None: return kept, total
+
+    for months in BUCKET_MONTHS:
+        buckets = {}
+        for m, item in sorted(firsts.items()): buckets.setdefault(m // months if m >= 0 else -1, item)
+        if len(buckets) < limit: break
+    picked = {item[0]: item for item in buckets.values()}
+    picked[latest[0]] = latest
+    return sorted(picked.values()), total
+
+def _chunk_key(member_name, chunk):
+    return hashlib.sha256(f"{MAP_VERSION}\n{member_name}\n{chunk}".encode("utf-8")).hexdigest()
+
+def _map_chunk(member_name, chunk):
+    key = _chunk_key(member_name, chunk)
+    notes = _notes.get(key)
+    if notes is not None:
+        metrics.incr("persona.map.cache_hits")
+        return notes
+    metrics.incr("persona.map.calls")
+    with metrics.timer("persona.map"):
+        result = brain.complete_json(MAP_PROMPT.format(member_name=member_name, chunk=chunk),
+                                     openai_model=MAP_MODELS[0], gemini_model=MAP_MODELS[1], deadline=60)
+    notes = {k: [str(x) for x in result.get(k, [])] for k in ("style", "catchphrases", "episodes")} if isinstance(result, dict) else {}
+    _notes.put(key, notes)
+    return notes
+
+def _bullets(items, limit):
+    return "\n".join(f"- {x}" for x in items[:limit]) or "(無)"
+
+def _tap(messages, name, stats, sampler):
+    """訊息照原樣往下傳，順便餵本機統計與主角原句抽樣"""
+    for msg in messages:
+        stats.add(msg)
+        if msg.sender == name: sampler.add(msg)
+        yield msg
+
+def distill(messages, member_name, target_role, on_progress=None):
+    """
+    messages: Message iterator (例如 line_chat.iter_messages)，只掃一遍
+    on_progress(done, total): 每完成一段呼叫一次 (在呼叫端執行緒)
+    回傳: {"system_prompt": ..., "flashback": ..., "style_notes": 本機統計文字 (已附在 reduce prompt)}
+    """
+    name = member_name.strip()
+    stats = style_stats.StyleStats(name)
+    sampler = line_chat.DigestSampler(REDUCE_SAMPLE_TOKENS)
+
+    with metrics.timer("persona.distill"):
+        picked, total = _select(_member_chunks(_tap(messages, name, stats, sampler), name))
+        if total == 0: raise ValueError(f"紀錄中找不到「{name}」說的話，請確認名字與 LINE 顯示名稱完全相同")
+        futures = {_pool.submit(_map_chunk, name, chunk): (i, first, last) for i, chunk, first, last in picked}
+
+        results = []
+        for done, future in enumerate(as_completed(futures), 1):
+            i, first, last = futures[future]
+            try:
+                results.append((i, first, last, future.result()))
+            except Exception as e:
+                print(f"Persona Map Error (chunk {i}): {e}")
+            if on_progress: on_progress(done, len(futures))
+        if not results: raise RuntimeError("所有段落分析都失敗了")
+        results.sort()
+
+        style = [f"[{first} ~ {last}] " + "；".join(n.get("style", [])[:5]) for _, first, last, n in results if n.get("style")]
+        counts = {}
+        for *_, n in results:
+            for c in n.get("catchphrases", []): counts[c] = counts.get(c, 0) + 1
+        catchphrases = sorted(counts, key=counts.get, reverse=True)
+        episodes = [f"({first}) {e}" for _, first, _, n in results for e in n.get("episodes", [])]
+
+        style_notes = style_stats.to_prompt(stats.result())
+        sample, info = sampler.result()
+        prompt = REDUCE_PROMPT.format(
+            member_name=name, target_role=target_role,
+            style=_bullets(style, MAX_CHUNKS), catchphrases="、".join(catchphrases[:20]) or "(無)",
+            episodes=_bullets(episodes, 60), first=info["first"], last=info["last"], sample=sample or "(無)"
+        )
+        if style_notes: prompt += f"\n{style_notes}\n"
+        result = brain.complete_json(prompt)
+    if isinstance(result, dict): result["style_notes"] = style_notes
+    return result
+
+def cache_stats():
+    return _notes.stats()
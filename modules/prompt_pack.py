@@ -0,0 +1,183 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from modules import audio, tts, tts_cache
+from modules.config import GUEST_PROMPTS, TEASER_PROMPT
+
+# ==========================================
+# 訪客固定台詞語音包 (單一檔案 + 偏移表，mmap 讀取)
+# ==========================================
+# 檔案格式 (little-endian)：
+#   header : magic(4) | version(u16) | count(u32) | fingerprint(32)
+#   table  : count 筆 [key(16) | offset(u64) | length(u32)]
+#   data   : 各段 MP3 依序串接
+# fingerprint = sha256(voice_id, 聲音版本, TTS 參數, 所有台詞)，任一改變就重建
+
+PACK_DIR = os.path.join(".cache", "packs")
+MAGIC = b"ESPK"
+VERSION = 1
+_HEADER = struct.Struct("<4sHI32s")
+_ENTRY = struct.Struct("<16sQI")
+
+PACK_ENGINE = "elevenlabs"
+BUILD_WORKERS = 2 # 建包時的併發數 (避免撞到 ElevenLabs 併發上限)
+BUILD_RETRIES = 3
+BUILD_RETRY_DELAY = 2.0
+REBUILD_COOLDOWN = 60 # 建置失敗後多久再試 (秒)
+
+_packs = {}
+_retired = [] # 已換下、還有切片在外面所以暫時關不掉的語音包
+_building = {} # voice_id -> 建置中的 fingerprint
+_retry_at = {}
+_lock = threading.Lock()
+_build_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-pack")
+
+def pack_texts(teasers):
+    """語音包要收錄的所有台詞"""
+    texts = list(GUEST_PROMPTS.values())
+    texts += [TEASER_PROMPT.format(q=t['q']) for t in teasers]
+    return texts
+
+def _key(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()[:16]
+
+def _fingerprint(voice_id, texts):
+    raw = json.dumps([
+        voice_id, tts_cache.voice_revision(voice_id),
+        tts.EL_MODEL_ID, tts.EL_VOICE_SETTINGS, texts
+    ], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).digest()
+
+class PromptPack:
+    """唯讀語音包：clip() 直接從 mmap 切出 memoryview，不複製"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        magic, version, count, self.fingerprint = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("語音包格式不符")
+        self._index = {}
+        pos = _HEADER.size
+        for _ in range(count):
+            key, offset, length = _ENTRY.unpack_from(self._mm, pos)
+            self._index[key] = (offset, length)
+            pos += _ENTRY.size
+
+    def clip(self, text):
+        hit = self._index.get(_key(text))
+        if not hit: return None
+        offset, length = hit
+        return self._view[offset:offset + length]
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        """釋放 mmap；還有 clip() 切片沒釋放時回傳 False (稍後再試)"""
+        try:
+            self._view.release()
+            self._mm.close()
+            return True
+        except BufferError:
+            return False
+
+def _synthesize(voice_id, text):
+    """只收 ElevenLabs 的聲音 (OpenAI alloy 備援不能進語音包)，暫時失敗就重試"""
+    # 預設聲音才寫進 TTS 磁碟快取 (訪客暫時聲音不落地)
+    persist = voice_id == st.secrets['VOICE_ID']
+    for attempt in range(BUILD_RETRIES):
+        data, engine = tts.synthesize(text, voice_id, persist=persist, engines=(PACK_ENGINE,))
+        if data and engine == PACK_ENGINE: return data
+        time.sleep(BUILD_RETRY_DELAY * (attempt + 1))
+    return None
+
+def build_pack(voice_id, texts, path):
+    """
+    批次合成所有台詞並寫成語音包 (先寫暫存檔再替換，讀取端不會讀到一半)
+    只要有一句合成失敗就不寫檔 (丟出 TTSError)，避免缺句的語音包一直留著
+    """
+    with ThreadPoolExecutor(max_workers=BUILD_WORKERS) as pool:
+        clips = list(pool.map(lambda t: _synthesize(voice_id, t), texts))
+    missing = sum(1 for c in clips if not c)
+    if missing: raise tts.TTSError(f"{missing}/{len(texts)} clips failed, pack not written")
+
+    entries = [(_key(t), c) for t, c in zip(texts, clips)]
+    offset = _HEADER.size + _ENTRY.size * len(entries)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(entries), _fingerprint(voice_id, texts)))
+        for key, clip in entries:
+            f.write(_ENTRY.pack(key, offset, len(clip)))
+            offset += len(clip)
+        for _, clip in entries:
+            f.write(clip)
+    os.replace(tmp, path)
+
+def _swap(voice_id, pack):
+    """換上新語音包並關閉舊的 mmap (還有人拿著切片就等下次再關)"""
+    old = _packs.get(voice_id)
+    _packs[voice_id] = pack
+    if old is not None and old is not pack: _retired.append(old)
+    _retired[:] = [p for p in _retired if not p.close()]
+
+def _build_async(voice_id, texts, fp, path):
+    """背景建包 (呼叫端需持有 _lock)；同一份 fingerprint 只會建一次，失敗後冷卻一段時間再試"""
+    if _building.get(voice_id) == fp or time.monotonic() < _retry_at.get(voice_id, 0): return
+    _building[voice_id] = fp
+
+    def _run():
+        try:
+            build_pack(voice_id, texts, path)
+            pack = PromptPack(path)
+            with _lock:
+                _swap(voice_id, pack)
+        except Exception as e:
+            print(f"Prompt Pack Build Error: {e}")
+            with _lock:
+                _retry_at[voice_id] = time.monotonic() + REBUILD_COOLDOWN
+        finally:
+            with _lock:
+                if _building.get(voice_id) == fp: del _building[voice_id]
+    _build_pool.submit(_run)
+
+def get_pack(teasers, voice_id=None):
+    """
+    取得目前的語音包；題庫或聲音變了會在背景重建
+    還沒建好 (或建置失敗) 時回傳 None，呼叫端改走逐句即時合成
+    """
+    voice_id = voice_id or st.secrets['VOICE_ID']
+    texts = pack_texts(teasers)
+    fp = _fingerprint(voice_id, texts)
+    path = os.path.join(PACK_DIR, f"{tts_cache._safe(voice_id)}.pack")
+
+    pack = _packs.get(voice_id)
+    if pack and pack.fingerprint == fp: return pack
+
+    with _lock: # 只保護換包與啟動建置，不在鎖內合成
+        pack = _packs.get(voice_id)
+        if pack and pack.fingerprint == fp: return pack
+        try:
+            disk = PromptPack(path) if os.path.exists(path) else None
+        except Exception as e:
+            print(f"Prompt Pack Error: {e}")
+            disk = None
+        if disk and disk.fingerprint == fp:
+            _swap(voice_id, disk)
+            return disk
+        if disk: disk.close()
+        _build_async(voice_id, texts, fp, path)
+        return None
+
+def prompt_audio(pack, text, tier):
+    """優先從語音包取音檔，沒有才即時合成"""
+    clip = pack.clip(text) if pack else None
+    if clip is not None: return clip
+    return audio.generate_speech(text, tier)
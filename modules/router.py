@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules import health, metrics
+
+# ==========================================
+# LLM 供應商路由 (延遲感知 + 斷路器 + 對沖請求)
+# ==========================================
+# providers: [(名稱, fn(timeout)), ...] 依偏好排序；fn 要把 timeout (秒) 傳給 SDK，逾時就會真的中斷
+# 1. 斷路器打開的供應商排到最後；送出前呼叫 allow()，half_open 一次只放一個試水溫
+# 2. hedge=True：首選在 p90 延遲內沒回應，就同時送出第二個，誰先成功用誰
+# 3. 首選失敗立刻改送下一個，不必等逾時
+# 4. deadline：整次呼叫的總秒數上限，超過丟 TimeoutError (每個請求的 SDK 逾時也只給剩餘秒數)
+# 5. 同時在跑的請求數有上限，卡住的請求不會把執行緒池吃光
+
+HEDGE_PERCENTILE = 90
+MIN_HEDGE_DELAY = 1.0 # 樣本不足時的預設對沖延遲 (秒)
+DEFAULT_HEDGE_DELAY = 4.0
+MAX_IN_FLIGHT = 8
+
+_pool = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="llm-router")
+_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+def _ordered(providers):
+    healthy = [p for p in providers if health.get(p[0]).available]
+    return healthy + [p for p in providers if p not in healthy]
+
+def _hedge_delay(name):
+    p = health.get(name).latency_percentile(HEDGE_PERCENTILE)
+    return max(MIN_HEDGE_DELAY, p) if p is not None else DEFAULT_HEDGE_DELAY
+
+def _run(name, fn, timeout):
+    start = time.perf_counter()
+    try:
+        result = fn(timeout)
+    except Exception:
+        elapsed = time.perf_counter() - start
+        health.get(name).record_failure(elapsed)
+        metrics.incr(f"llm.{name}.errors")
+        raise
+    finally:
+        _slots.release()
+    elapsed = time.perf_counter() - start
+    health.get(name).record_success(elapsed)
+    metrics.record(f"llm.{name}", elapsed)
+    return result
+
+def call(providers, deadline=30.0, hedge=False):
+    """
+    依路由策略呼叫，回傳第一個成功的結果
+    全部失敗丟出最後一個錯誤；超過 deadline 丟 TimeoutError
+    """
+    queue = _ordered(providers)
+    end = time.monotonic() + deadline
+    running = {} # future -> 名稱
+    last_error = None
+
+    def _launch(wait_for_slot):
+        """送出佇列裡下一個允許的供應商；沒有可送的回傳 False"""
+        while queue:
+            remaining = end - time.monotonic()
+            if remaining <= 0: return False
+            name, fn = queue.pop(0)
+            h = health.get(name)
+            if not h.allow():
+                metrics.incr(f"llm.{name}.skipped")
+                continue
+            if not _slots.acquire(timeout=remaining if wait_for_slot else 0):
+                h.release()
+                metrics.incr("llm.saturated")
+                return False
+            running[_pool.submit(_run, name, fn, end - time.monotonic())] = name
+            metrics.incr(f"llm.{name}.calls")
+            return True
+        return False
+
+    _launch(wait_for_slot=True)
+    while running:
+        remaining = end - time.monotonic()
+        if remaining <= 0: break
+        # 還有備援且允許對沖：等到首選的 p90 就送出下一個
+        timeout = remaining
+        if hedge and queue and len(running) == 1:
+            timeout = min(remaining, _hedge_delay(next(iter(running.values()))))
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            name = running.pop(future)
+            try:
+                result = future.result()
+                metrics.incr(f"llm.{name}.wins")
+                return result
+            except Exception as e:
+                print(f"Router: {name} failed: {e}")
+                last_error = e
+        if done:
+            if not running: _launch(wait_for_slot=True)
+        elif hedge and queue and len(running) == 1 and _launch(wait_for_slot=False):
+            metrics.incr("llm.hedges")
+
+    if running: raise TimeoutError(f"LLM 呼叫超過 {deadline} 秒")
+    raise last_error or RuntimeError("沒有可用的 LLM 供應商")
+
+def stream(providers, deadline=30.0):
+    """
+    串流版 call (generator)：依序嘗試，逐段吐出 fn(timeout) 產生的內容
+    某供應商已吐出內容後才失敗，就不再換供應商 (丟出錯誤)；串流不對沖
+    """
+    end = time.monotonic() + deadline
+    last_error = None
+    for name, fn in _ordered(providers):
+        remaining = end - time.monotonic()
+        if remaining <= 0: break
+        h = health.get(name)
+        if not h.allow():
+            metrics.incr(f"llm.{name}.skipped")
+            continue
+        metrics.incr(f"llm.{name}.calls")
+        start, emitted = time.perf_counter(), False
+        try:
+            for piece in fn(remaining):
+                emitted = True
+                yield piece
+        except GeneratorExit:
+            h.release() # 呼叫端中途放棄，不計成敗
+            raise
+        except Exception as e:
+            h.record_failure(time.perf_counter() - start)
+            metrics.incr(f"llm.{name}.errors")
+            print(f"Router: {name} stream failed: {e}")
+            if emitted: raise
+            last_error = e
+            continue
+        elapsed = time.perf_counter() - start
+        h.record_success(elapsed)
+        metrics.record(f"llm.{name}", elapsed)
+        metrics.incr(f"llm.{name}.wins")
+        return
+    if time.monotonic() >= end: raise TimeoutError(f"LLM 串流超過 {deadline} 秒")
+    raise last_error or RuntimeError("沒有可用的 LLM 供應商")
@@ -0,0 +1,119 @@
+import re
+import threading
+import unicodedata
+from collections import deque
+import numpy as np
+from modules import database, metrics
+from modules.cache import LRUCache
+
+# ==========================================
+# 相聲劇本語意快取
+# ==========================================
+# key = (題目, 標準答案, 對錯判定, 正規化後的訪客回答)；劇本 prompt 要求會員名字寫成 {member} 佔位，跨會員共用
+# 完全相同的回答直接命中；否則用 embedding 找同一題、同一種判定裡相似度 >= 門檻的舊回答
+# 對錯判定只是「回答裡有沒有標準答案」的粗判，用來降低答錯沿用答對劇本的機會，不是保證
+# 模型沒照做、劇本裡留著太短無法安全替換的名字時，這筆只給同一個會員用 (不跨會員共用)
+
+MEMBER_SLOT = "{member}"
+SIMILARITY_THRESHOLD = 0.92
+MAX_PER_QUESTION = 50 # 每題最多保留幾個回答做語意比對
+MIN_NAME_LEN = 3 # 模型沒照做、直接寫出名字時，夠長的名字才整段換回佔位 (「我」「爸」這種會誤換台詞)
+
+# 系統引導訪客唸的咒語，全部視為同一種回答 (對應劇本 prompt 的第 1 條邏輯)
+SPELL_WORDS = ("天靈靈", "麥克風測試", "聽不清楚")
+SPELL_BUCKET = "<spell>"
+
+_exact = LRUCache(max_items=1000)
+_semantic = {} # (question, correct_answer, verdict, owner) -> deque[(normalized_answer, unit vector, template)]
+_lock = threading.Lock()
+_stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+def normalize_answer(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    if any(w in text for w in SPELL_WORDS): return SPELL_BUCKET
+    return re.sub(r"[\W_]+", "", text)
+
+def _verdict(norm, correct_answer):
+    """粗判訪客回答屬於哪一種劇本 (咒語 / 答對 / 其他)"""
+    if norm == SPELL_BUCKET: return "spell"
+    answer = normalize_answer(correct_answer)
+    return "correct" if answer and answer in norm else "other"
+
+def _to_template(script, member_name):
+    """
+    回傳 (劇本模板, 擁有者)：擁有者為 None 代表可以跨會員共用
+    名字太短不能整段替換、又還留在台詞裡時，擁有者是該會員
+    """
+    name = (member_name or "").strip()
+    if len(name) >= MIN_NAME_LEN:
+        return [{**line, "text": str(line.get("text", "")).replace(name, MEMBER_SLOT)} for line in script], None
+    template = [dict(line) for line in script]
+    leaked = name and any(name in str(line.get("text", "")) for line in template)
+    return template, (name if leaked else None)
+
+def _groups(question, correct_answer, norm, member_name):
+    """lookup 要查的分組：共用的 + 這個會員自己的"""
+    base = (question, correct_answer, _verdict(norm, correct_answer))
+    return [base + (None,), base + ((member_name or "").strip(),)]
+
+def fill_member(template, member_name):
+    """把劇本裡的 {member} 佔位換成會員名字"""
+    return [{**line, "text": str(line.get("text", "")).replace(MEMBER_SLOT, member_name)} for line in template]
+
+def _unit(vec):
+    v = np.asarray(vec, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+def _bump(name):
+    with _lock:
+        _stats[name] += 1
+    metrics.incr(f"script_cache.{name}")
+
+def lookup(question, correct_answer, user_answer, member_name):
+    """回傳已替換會員名字的劇本，未命中回傳 None"""
+    norm = normalize_answer(user_answer)
+    groups = _groups(question, correct_answer, norm, member_name)
+    for group in groups:
+        template = _exact.get(group + (norm,))
+        if template is not None:
+            _bump("exact_hits")
+            return fill_member(template, member_name)
+
+    with _lock:
+        candidates = [c for group in groups for c in _semantic.get(group, ())]
+    if candidates and norm != SPELL_BUCKET:
+        try:
+            q = _unit(database.get_embedding(norm))
+            scores = np.stack([c[1] for c in candidates]) @ q
+            best = int(np.argmax(scores))
+            if scores[best] >= SIMILARITY_THRESHOLD:
+                _bump("semantic_hits")
+                return fill_member(candidates[best][2], member_name)
+        except Exception as e:
+            print(f"Script Cache Error: {e}")
+
+    _bump("misses")
+    return None
+
+def store(question, correct_answer, user_answer, member_name, script):
+    """script: 模型產生的劇本 (會員名字是 {member} 佔位)"""
+    norm = normalize_answer(user_answer)
+    template, owner = _to_template(script, member_name)
+    group = (question, correct_answer, _verdict(norm, correct_answer), owner)
+    _exact.put(group + (norm,), template)
+    if norm == SPELL_BUCKET or not norm: return
+    try:
+        vec = _unit(database.get_embedding(norm)) # 嵌入結果有快取，lookup 已算過就不會再打 API
+    except Exception as e:
+        print(f"Script Cache Error: {e}")
+        return
+    with _lock:
+        _semantic.setdefault(group, deque(maxlen=MAX_PER_QUESTION)).append((norm, vec, template))
+
+def stats():
+    with _lock:
+        s = dict(_stats)
+    total = sum(s.values())
+    s["hit_ratio"] = (s["exact_hits"] + s["semantic_hits"]) / total if total else 0.0
+    return s
@@ -1,3 +1,4 @@
+import time
 import streamlit as st
 
 def init_session_state():
@@ -16,3 +17,34 @@ def init_session_state():
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
+
+# ==========================================
+# Session 層級快取 / 資料版本號
+# ==========================================
+
+def session_cache(name):
+    """取得 session_state 裡的一個 dict 快取 (不在 Streamlit 執行環境時回傳一次性的 dict)"""
+    try: return st.session_state.setdefault(name, {})
+    except: return {}
+
+def bump_version(name):
+    """資料有異動時 +1，依賴它的物化值 (例如相似度) 會自動重算"""
+    versions = session_cache("_data_versions")
+    versions[name] = versions.get(name, 0) + 1
+
+def get_version(name):
+    return session_cache("_data_versions").get(name, 0)
+
+def versioned(cache_name, version_names, key, fetch, ttl):
+    """
+    session 內記住 fetch() 的結果，依賴的資料版本號變動 (本 session 寫入) 或超過 TTL (其他 session 可能寫入) 就重讀
+    version_names: 一個或多個版本號名稱；fetch 丟出例外時不快取
+    """
+    names = (version_names,) if isinstance(version_names, str) else tuple(version_names)
+    version = tuple(get_version(n) for n in names)
+    cache = session_cache(cache_name)
+    hit = cache.get(key)
+    if hit and hit[0] == version and hit[1] > time.time(): return hit[2]
+    value = fetch()
+    cache[key] = (version, time.time() + ttl, value)
+    return value
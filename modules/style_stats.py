@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from modules import line_chat, metrics
+
+# ==========================================
+# 說話習慣統計 (本機向量化計算，不需要 LLM)
+# ==========================================
+# 串流讀訊息，每 BATCH_SIZE 則用 pandas / numpy 整批計算後累加：
+# - 字元 n-gram (2、3 字) 頻率 -> 口頭禪候選
+# - 句尾語氣助詞分布、訊息長度、貼圖 / 表情符號比例
+# - 回覆間隔 (對方說完到主角回話) 與活躍時段
+# 記憶體只放一批訊息 + 固定大小的 n-gram 計數表
+
+BATCH_SIZE = 20000
+MAX_VOCAB = 100000 # 每種 n-gram 最多保留的計數項目 (超過只留最高頻的)
+MAX_LENGTH_BIN = 200
+MAX_REPLY_MINUTES = 24 * 60 # 超過一天才回不算「回覆」，是另開新話題
+
+PARTICLES = list("啦喔哦耶吧嘛呢啊呀欸唷咧囉捏齁嗎哈嘿哇噢唉") # 句尾拖「~」的算成「喔~」，單獨的「~」另外算
+STICKERS = ("[貼圖]", "[Sticker]") # 中文 / 英文介面
+MIN_CATCHPHRASE_COUNT = 5 # 口頭禪至少出現幾次
+MIN_CATCHPHRASE_SHARE = 0.005 # 且至少是文字訊息數的這個比例 (對話量大時門檻跟著提高)
+EMOJI_PATTERN = r"[\U0001F300-\U0001FAFF☀-➿]|\(emoji\)"
+_TRAILING_PUNCT = r"[\s\W_]+$"
+
+def _ngram_keys(texts, n):
+    """把整批文字轉成碼位陣列，n 個連續漢字/假名編成一個 uint64 (每字 21 bits)"""
+    cp = np.frombuffer("\x00".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    ok = ((cp >= 0x3400) & (cp <= 0x9FFF)) | ((cp >= 0x3040) & (cp <= 0x30FF))
+    if len(cp) < n: return np.empty(0, dtype=np.uint64)
+    keys = np.zeros(len(cp) - n + 1, dtype=np.uint64)
+    valid = np.ones(len(cp) - n + 1, dtype=bool)
+    for i in range(n):
+        part = cp[i:len(cp) - n + 1 + i]
+        keys = (keys << np.uint64(21)) | part
+        valid &= ok[i:len(cp) - n + 1 + i]
+    return keys[valid]
+
+def _decode_key(key, n):
+    return "".join(chr((int(key) >> (21 * (n - 1 - i))) & 0x1FFFFF) for i in range(n))
+
+def _merge(table, new_keys, limit=MAX_VOCAB):
+    """把新一批 n-gram 併入計數表，超過上限只留最高頻的"""
+    if not len(new_keys): return table
+    keys, counts = table
+    batch_keys, batch_counts = np.unique(new_keys, return_counts=True)
+    uniq, inv = np.unique(np.concatenate([keys, batch_keys]), return_inverse=True)
+    summed = np.bincount(inv, weights=np.concatenate([counts, batch_counts])).astype(np.int64)
+    if len(uniq) > limit:
+        top = np.argpartition(summed, -limit)[-limit:]
+        uniq, summed = uniq[top], summed[top]
+    return uniq, summed
+
+def _top(table, n, k):
+    keys, counts = table
+    if not len(keys): return []
+    order = np.argsort(-counts, kind="stable")[:k]
+    return [(_decode_key(keys[i], n), int(counts[i])) for i in order]
+
+class StyleStats:
+    """逐批累加的統計量；add() 逐則餵 (湊滿一批才計算) 或 feed() 直接吃一批，result() 輸出精簡摘要"""
+    def __init__(self, member_name, batch_size=BATCH_SIZE):
+        self.member_name = member_name.strip()
+        self.batch_size = batch_size
+        self._batch = ([], [], [], []) # date, time, sender, text
+        self.total = 0 # 所有人的訊息數
+        self.messages = 0 # 主角的訊息數
+        self.stickers = 0
+        self.text_messages = 0
+        self.emoji_messages = 0
+        self.emoji = pd.Series(dtype=np.int64)
+        self.particles = pd.Series(dtype=np.int64)
+        self.short_messages = pd.Series(dtype=np.int64) # 整句重複的短訊息 (例如「好喔」「哈哈哈」)
+        self.lengths = np.zeros(MAX_LENGTH_BIN + 1, dtype=np.int64)
+        self.reply_minutes = np.zeros(MAX_REPLY_MINUTES + 1, dtype=np.int64)
+        self.hours = np.zeros(24, dtype=np.int64)
+        self.grams = {n: (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)) for n in (2, 3)}
+        self._carry = (False, np.datetime64("NaT", "m")) # 上一批最後一則：(是不是主角, 時間)
+
+    def add(self, msg):
+        """一則 Message (系統訊息略過)；可以和分段、抽樣共用同一次掃描"""
+        if not msg.sender: return
+        for col, value in zip(self._batch, msg): col.append(value)
+        if len(self._batch[0]) >= self.batch_size: self.flush()
+
+    def flush(self):
+        dates, times, senders, texts = self._batch
+        if dates:
+            with metrics.timer("persona.style_stats"):
+                self.feed(senders, dates, times, texts)
+        self._batch = ([], [], [], [])
+
+    def feed(self, senders, dates, times, texts):
+        """一批訊息 (只含有發言人的訊息，依時間排序)"""
+        is_member = np.asarray([s == self.member_name for s in senders], dtype=bool)
+        stamps = pd.to_datetime(pd.Series(dates, dtype=object).fillna("") + " " + pd.Series(times, dtype=object),
+                                format="%Y-%m-%d %H:%M", errors="coerce").to_numpy("datetime64[m]")
+        self.total += len(senders)
+        self.messages += int(is_member.sum())
+
+        # --- 回覆間隔：對方說完 -> 主角的下一則 ---
+        prev_member = np.concatenate([[self._carry[0]], is_member[:-1]])
+        prev_stamps = np.concatenate([[self._carry[1]], stamps[:-1]])
+        gap = stamps - prev_stamps
+        reply = is_member & ~prev_member & ~np.isnat(gap)
+        minutes = gap[reply].astype(np.int64)
+        minutes = minutes[(minutes >= 0) & (minutes <= MAX_REPLY_MINUTES)]
+        self.reply_minutes += np.bincount(minutes, minlength=MAX_REPLY_MINUTES + 1)
+        if len(senders): self._carry = (bool(is_member[-1]), stamps[-1])
+
+        member_stamps = stamps[is_member]
+        member_stamps = member_stamps[~np.isnat(member_stamps)]
+        hours = (member_stamps - member_stamps.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
+        self.hours += np.bincount(hours, minlength=24)
+
+        # --- 主角的文字 ---
+        # 維持 object dtype：pandas 3 的 str dtype 走 pyarrow 正規式，\W 只認 ASCII，會把中文當標點刪掉
+        s = pd.Series([str(t) for t, m in zip(texts, is_member) if m], dtype=object)
+        if s.empty: return
+        self.stickers += int(s.isin(STICKERS).sum())
+        text = s[~s.isin(line_chat.MEDIA_TOKENS) & ~s.str.contains(line_chat.NOISE_PATTERN, regex=True)]
+        text = text.str.replace(r"\s+", " ", regex=True).str.strip()
+        text = text[text != ""]
+        if text.empty: return
+        self.text_messages += len(text)
+
+        self.lengths += np.bincount(np.minimum(text.str.len().to_numpy(), MAX_LENGTH_BIN), minlength=MAX_LENGTH_BIN + 1)
+
+        emoji = text.str.findall(EMOJI_PATTERN)
+        self.emoji_messages += int((emoji.str.len() > 0).sum())
+        self.emoji = self.emoji.add(emoji.explode().dropna().value_counts(), fill_value=0)
+
+        # 每則只算一次：「喔」「喔~」「~」是三種不同的句尾 (「~」會被當成標點去掉，另外判斷)
+        last = text.str.replace(_TRAILING_PUNCT, "", regex=True).str[-1:]
+        tilde = text.str.contains(r"[~～]\s*$", regex=True)
+        particle = last.isin(PARTICLES)
+        endings = pd.concat([last[particle & ~tilde], last[particle & tilde] + "~", pd.Series("~", index=text.index[tilde & ~particle])])
+        self.particles = self.particles.add(endings.value_counts(), fill_value=0)
+
+        short = text[text.str.len() <= 6]
+        self.short_messages = self.short_messages.add(short.value_counts(), fill_value=0)
+        if len(self.short_messages) > MAX_VOCAB: self.short_messages = self.short_messages.nlargest(MAX_VOCAB)
+
+        texts = text.tolist()
+        for n in self.grams: self.grams[n] = _merge(self.grams[n], _ngram_keys(texts, n))
+
+    def result(self, top_k=10):
+        """精簡摘要 (dict)，可直接轉成 prompt 文字"""
+        self.flush()
+        n_text = max(self.text_messages, 1)
+        bins = np.arange(MAX_LENGTH_BIN + 1)
+        replies = int(self.reply_minutes.sum())
+        cum = np.cumsum(self.reply_minutes)
+
+        def reply_pct(p):
+            return int(np.searchsorted(cum, p / 100 * replies)) if replies else None
+
+        floor = max(MIN_CATCHPHRASE_COUNT, MIN_CATCHPHRASE_SHARE * self.text_messages)
+        tri = [(g, c) for g, c in _top(self.grams[3], 3, top_k) if c >= floor]
+        bi = [(g, c) for g, c in _top(self.grams[2], 2, top_k * 3) if c >= floor and not any(g in t for t, _ in tri)][:top_k]
+        repeated = self.short_messages[self.short_messages >= 3].nlargest(top_k)
+        return {
+            "messages": self.messages, "total": self.total,
+            "avg_length": round(float((bins * self.lengths).sum()) / n_text, 1),
+            "median_length": int(np.searchsorted(np.cumsum(self.lengths), n_text / 2)) if self.text_messages else 0,
+            "sticker_rate": round(self.stickers / max(self.messages, 1), 3),
+            "emoji_rate": round(self.emoji_messages / n_text, 3),
+            "top_emoji": [str(e) for e in self.emoji.nlargest(5).index],
+            "particles": [(str(p), round(float(c) / n_text, 3)) for p, c in self.particles.nlargest(8).items()],
+            "catchphrases": [g for g, _ in tri] + [g for g, _ in bi],
+            "repeated_messages": [str(m) for m in repeated.index],
+            "reply_minutes": {"p50": reply_pct(50), "p90": reply_pct(90), "samples": replies},
+            "active_hours": [int(h) for h in np.argsort(-self.hours, kind="stable")[:3]] if self.hours.any() else [],
+        }
+
+def compute(messages, member_name, batch_size=BATCH_SIZE):
+    """
+    messages: Message iterator (line_chat.iter_messages)
+    回傳 StyleStats.result() 的摘要；每批計算耗時記在 metrics: persona.style_stats
+    """
+    stats = StyleStats(member_name, batch_size)
+    for msg in messages: stats.add(msg)
+    return stats.result()
+
+def to_prompt(result):
+    """轉成給 LLM 看的精簡文字 (也會附在人設後面存檔)"""
+    if not result or not result.get("messages"): return ""
+    lines = [f"- 訊息數：{result['messages']} 則，平均 {result['avg_length']} 字 (中位數 {result['median_length']} 字)"]
+    if result["catchphrases"]: lines.append(f"- 高頻用語：{'、'.join(result['catchphrases'])}")
+    if result["repeated_messages"]: lines.append(f"- 常單獨傳的短句：{'、'.join(result['repeated_messages'])}")
+    if result["particles"]:
+        lines.append("- 句尾語氣詞：" + "、".join(f"{p} ({share:.0%})" for p, share in result["particles"]))
+    lines.append(f"- 貼圖比例 {result['sticker_rate']:.0%}，含表情符號的訊息 {result['emoji_rate']:.0%}"
+                 + (f" (常用 {' '.join(result['top_emoji'])})" if result["top_emoji"] else ""))
+    reply = result["reply_minutes"]
+    if reply["samples"]: lines.append(f"- 回覆速度：一半在 {reply['p50']} 分鐘內，九成在 {reply['p90']} 分鐘內")
+    if result["active_hours"]: lines.append(f"- 最常聊天的時段：{'、'.join(f'{h} 點' for h in result['active_hours'])}")
+    return "【說話習慣統計 (本機計算)】\n" + "\n".join(lines)
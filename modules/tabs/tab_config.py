@@ -51,5 +51,5 @@ def render(supabase, tier, xp):
         if real_nick_audio:
             if st.button("💾 上傳真實聲音"):
                 with st.spinner("處理中..."):
-                    if audio.upload_nickname_audio(supabase, nick_role, real_nick_audio.read()):
+                    if audio.upload_audio_file(supabase, nick_role, real_nick_audio.read(), "nickname"):
                         st.success("成功！AI 將使用這段錄音作為開場。")
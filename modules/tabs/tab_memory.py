@@ -1,5 +1,5 @@
 import streamlit as st
-from modules import ui, database, audio
+from modules import ui, database, audio, transcribe
 
 def render(supabase, client, user_id, target_role, tier, xp, question_db):
     # 權限檢查
@@ -69,8 +69,8 @@ def render(supabase, client, user_id, target_role, tier, xp, question_db):
             if audio_ans:
                 # 轉文字
                 with st.spinner("語音轉文字中..."):
-                    trans = client.audio.transcriptions.create(model="whisper-1", file=audio_ans)
-                    st.session_state.trans_text = trans.text
+                    # 同一段錄音只轉一次 (rerun、試聽、修改文字都不會重新轉錄)
+                    st.session_state.trans_text = transcribe.transcribe(audio_ans)
                 
                 # 讓用戶編輯/確認文字
                 final_text = st.text_area("文字確認 (可修改)", value=st.session_state.trans_text, key="mem_edit_area")
@@ -1,6 +1,5 @@
 import streamlit as st
-import json
-from modules import database, audio
+from modules import database, audio, line_chat, persona_distill
 
 def render(supabase, client, user_id, target_role, tier, xp):
     # 權限檢查
@@ -75,55 +74,34 @@ def render(supabase, client, user_id, target_role, tier, xp):
         if up_file and member_name:
             with st.spinner("GPT-4o 正在閱讀回憶、尋找感動瞬間..."):
                 try:
-                    # 讀取檔案
-                    raw = up_file.read().decode("utf-8")
+                    # 逐行讀上傳檔 (只讀一遍)，不把整個檔案讀進記憶體
+                    messages = line_chat.iter_messages(line_chat.read_lines(up_file))
                     
-                    # 構建 Prompt (JSON 格式)
-                    prompt = f"""
-                    分析這份 LINE 對話紀錄。
-                    
-                    【角色定義】：
-                    - 主角 (我)：{member_name}
-                    - 對話對象：{target_role}
-                    
-                    【任務目標】：
-                    1. **語氣分析**：深度模仿【主角】的說話風格（口頭禪、語氣助詞、斷句習慣）。
-                    2. **稱呼規範**：在生成的對話中，請一律使用「我」自稱，並用「你」稱呼對方。**絕對不要**在句子中加入對方的名字或暱稱（因為系統會在語音開頭自動拼接真實呼喚）。
-                    3. **回憶提取**：請從對話中找出一段具體、溫馨或有趣的「往事」（例如一起去過哪裡、吃過什麼、發生的小意外）。
-                    
-                    【輸出格式 (JSON)】：
-                    請直接回傳以下 JSON 格式，不要有其他文字：
-                    {{
-                        "system_prompt": "你現在扮演... (請填入完整的人設指令)",
-                        "flashback": "還記得那天..." (請填入提取出的往事，用口語表達，約 30-50 字)
-                    }}
-                    
-                    資料片段：
-                    {raw[-30000:]} 
-                    """
-
-                    # 呼叫 GPT-4o (強制 JSON 模式)
-                    response = client.chat.completions.create(
-                        model="gpt-4o", 
-                        messages=[{"role": "user", "content": prompt}],
-                        response_format={ "type": "json_object" }
-                    )
+                    # 整段歷史切段平行萃取 (gpt-4o-mini)，再由 GPT-4o 彙整 (見 persona_distill.py)
+                    # 口頭禪、語氣詞、回覆速度等本機統計在同一次掃描完成 (不花 token)
+                    progress = st.progress(0.0, text="分段閱讀對話紀錄...")
+                    def on_progress(done, total):
+                        progress.progress(done / total, text=f"分段閱讀對話紀錄... {done}/{total}")
+                    result = persona_distill.distill(messages, member_name, target_role, on_progress=on_progress)
+                    progress.empty()
                     
                     # 解析結果
-                    result = json.loads(response.choices[0].message.content)
                     sys_prompt = result.get('system_prompt', '')
                     flashback_text = result.get('flashback', '')
+                    style_notes = result.get('style_notes', '')
                     
-                    # 1. 存入資料庫
-                    database.save_persona_summary(supabase, target_role, sys_prompt, member_nickname=current_identity)
+                    # 0. 往事語音先在背景合成，下面寫資料庫、下載暱稱時同步進行
+                    # 這裡 tier 若 app.py 沒傳入，先給預設 'advanced' (既然都付費到這裡了)
+                    current_tier = tier if tier else 'advanced'
+                    flashback_future = audio.start_speech(flashback_text, current_tier)
+                    
+                    # 1. 存入資料庫 (統計結果附在人設後面，對話時一起參考)
+                    content = f"{sys_prompt}\n\n{style_notes}" if style_notes else sys_prompt
+                    database.save_persona_summary(supabase, target_role, content, member_nickname=current_identity)
                     
                     # 2. 準備驚喜 (語音生成 + 拼接)
                     nick_bytes = audio.get_audio_bytes(supabase, target_role, "nickname")
-                    
-                    # 生成往事語音 (這裡 tier 若 app.py 沒傳入可能報錯，建議修正 app.py 或這裡給預設值)
-                    # 假設 app.py 有傳入 tier, xp. 若無，先給預設 'advanced' (既然都付費到這裡了)
-                    current_tier = tier if tier else 'advanced'
-                    flashback_audio = audio.generate_speech(flashback_text, current_tier)
+                    flashback_audio = flashback_future.result()
                     
                     # 拼接
                     final_audio = flashback_audio
@@ -115,18 +115,20 @@ def render(supabase, client, user_id, target_role, tier):
                     content = p['content'] if p else "尚未設定人設"
                     database.save_persona_summary(supabase, target_role, content, member_nickname=member_nick)
 
+                    # 轉檔一次 (裁靜音 + 壓縮)，存檔與試聽都用轉好的版本
+                    clip = audio.ingest_recording(audio_bytes)
                     if target_role == "friend":
-                        audio.upload_audio_file(supabase, target_role, audio_bytes, "opening")
+                        audio.upload_audio_file(supabase, target_role, clip, "opening", transcode=False)
                     else:
-                        audio.upload_audio_file(supabase, target_role, audio_bytes, "nickname")
-                        audio.upload_audio_file(supabase, target_role, audio_bytes, "opening")
+                        audio.upload_audio_file(supabase, target_role, clip, "nickname", transcode=False)
+                        audio.upload_audio_file(supabase, target_role, clip, "opening", transcode=False)
                     
-                    rec.seek(0)
-                    audio.train_voice_sample(rec.read())
+                    # 訓練用原始錄音 (保留完整音質)
+                    audio.train_voice_sample(audio_bytes)
                     database.update_profile_stats(supabase, user_id, xp_delta=1, log_reason="完成Step1")
                     
                     ai_wav = audio.generate_speech(ai_demo_text, tier)
-                    final = audio.merge_audio_clips(audio_bytes, ai_wav)
+                    final = audio.merge_audio_clips(clip, ai_wav)
                     st.audio(final, format="audio/mp3")
                     st.success("設定已儲存！獲得 1 點共鳴值")
 
@@ -167,12 +169,11 @@ def render(supabase, client, user_id, target_role, tier):
             if st.button("💾 上傳並覆蓋舊檔"):
                 with st.spinner("訓練 Voice ID 並存檔中..."):
                     ab = rec.read()
-                    # 1. 存入 Supabase (覆蓋舊檔)
+                    # 1. 存入 Supabase (覆蓋舊檔，上傳前會先轉檔壓縮)
                     audio.upload_audio_file(supabase, target_role, ab, cfg["file"])
                     
-                    # 2. 訓練 AI (疊加訓練)
-                    rec.seek(0)
-                    audio.train_voice_sample(rec.read())
+                    # 2. 訓練 AI (疊加訓練，用原始錄音)
+                    audio.train_voice_sample(ab)
                     
                     database.update_profile_stats(supabase, user_id, xp_delta=1, log_reason=f"Step{st.session_state.step}")
                     st.success("已更新訓練樣本！ (+1 XP)")
@@ -0,0 +1,77 @@
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+from pydub import AudioSegment
+from modules import state, metrics, transport
+from modules.cache import LRUCache
+
+# ==========================================
+# 語音轉文字服務 (Whisper)
+# ==========================================
+# 1. 以錄音內容 hash 為 key，session + 行程兩層記憶，rerun 不再重複轉錄
+# 2. 上傳前降到 16kHz 單聲道並壓成 MP3 (Whisper 內部也是 16kHz，音質不受影響)
+# 3. 長錄音切段平行轉錄後再接回
+
+WHISPER_MODEL = "whisper-1"
+TARGET_RATE = 16000
+TARGET_BITRATE = "32k"
+CHUNK_MS = 60 * 1000 # 超過 60 秒就切段
+
+try:
+    client = transport.openai_client()
+except: client = None
+
+_memo = LRUCache(max_items=500)
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="whisper")
+
+def _read(audio_input):
+    """接受 bytes 或 st.audio_input / file_uploader 的檔案物件"""
+    if isinstance(audio_input, (bytes, bytearray, memoryview)): return bytes(audio_input)
+    if hasattr(audio_input, "getvalue"): return audio_input.getvalue()
+    audio_input.seek(0)
+    return audio_input.read()
+
+def _prepare_chunks(raw):
+    """降取樣 + 壓縮 + 切段，回傳 [(檔名, bytes, mime), ...]；無法解碼就原檔送出"""
+    try:
+        seg = AudioSegment.from_file(io.BytesIO(raw)).set_channels(1).set_frame_rate(TARGET_RATE)
+    except Exception as e:
+        print(f"Transcribe Decode Error: {e}")
+        return [("audio.wav", raw, "audio/wav")]
+    chunks = []
+    for start in range(0, max(len(seg), 1), CHUNK_MS):
+        buffer = io.BytesIO()
+        seg[start:start + CHUNK_MS].export(buffer, format="mp3", bitrate=TARGET_BITRATE)
+        chunks.append((f"chunk_{start // CHUNK_MS}.mp3", buffer.getvalue(), "audio/mpeg"))
+    return chunks
+
+def _transcribe_chunk(chunk):
+    return client.audio.transcriptions.create(model=WHISPER_MODEL, file=chunk).text
+
+def transcribe(audio_input):
+    """語音轉文字，失敗回傳空字串"""
+    try:
+        raw = _read(audio_input)
+    except: return ""
+    if not raw: return ""
+    key = hashlib.sha256(raw).hexdigest()
+
+    session_memo = state.session_cache("_transcripts")
+    if key in session_memo: return session_memo[key]
+    text = _memo.get(key)
+    if text is not None:
+        session_memo[key] = text
+        return text
+
+    metrics.incr("transcribe.requests")
+    try:
+        with metrics.timer("transcribe.latency"):
+            chunks = _prepare_chunks(raw)
+            texts = list(_pool.map(_transcribe_chunk, chunks))
+        text = "".join(texts).strip()
+    except Exception as e:
+        print(f"Transcribe Error: {e}")
+        return ""
+    _memo.put(key, text)
+    session_memo[key] = text
+    return text
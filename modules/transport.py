@@ -0,0 +1,102 @@
+import threading
+import httpx
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from openai import OpenAI
+from modules import metrics
+
+# ==========================================
+# 共用連線層 (keep-alive 連線池)
+# ==========================================
+# 每個上游一個 requests.Session，整個行程共用 -> 不再每次呼叫都重新 TCP + TLS 握手
+# OpenAI 全站共用一個 client (底層 httpx 連線池)
+# 連線池大小與逾時可在 secrets 調整：HTTP_POOL_SIZE / HTTP_TIMEOUT / OPENAI_TIMEOUT
+
+def _setting(name, default):
+    try: return st.secrets.get(name, default)
+    except: return default
+
+POOL_SIZE = int(_setting("HTTP_POOL_SIZE", 10))
+DEFAULT_TIMEOUT = (3.05, float(_setting("HTTP_TIMEOUT", 30))) # (連線, 讀取)
+# OpenAI 另外設定：長文 GPT-4o 分析、長錄音 Whisper 都可能跑好幾分鐘 (與 SDK 預設相同 600 秒)
+# 需要更短的請在呼叫端用 .with_options(timeout=...)
+OPENAI_TIMEOUT = (5.0, float(_setting("OPENAI_TIMEOUT", 600)))
+
+_lock = threading.Lock()
+_sessions = {}
+_openai = None
+
+class _PooledSession(requests.Session):
+    """記錄使用中連線數的 Session (沒指定 timeout 時套用預設值)"""
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, pool_block=False, max_retries=0)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        with self._count_lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            return super().request(method, url, **kwargs)
+        finally:
+            with self._count_lock:
+                self.in_flight -= 1
+
+def session(name):
+    """取得某上游的共用 Session，例如 session("elevenlabs")"""
+    with _lock:
+        if name not in _sessions: _sessions[name] = _PooledSession(name)
+        return _sessions[name]
+
+def openai_client():
+    """全站共用的 OpenAI client (需要不同逾時/重試請用 .with_options()，會共用同一個連線池)"""
+    global _openai
+    with _lock:
+        if _openai is None:
+            def _count(request):
+                metrics.incr("http.openai.requests")
+            timeout = httpx.Timeout(OPENAI_TIMEOUT[1], connect=OPENAI_TIMEOUT[0])
+            _openai = OpenAI(
+                api_key=st.secrets["OPENAI_API_KEY"],
+                timeout=timeout,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=POOL_SIZE * 2, max_keepalive_connections=POOL_SIZE),
+                    timeout=timeout,
+                    event_hooks={"request": [_count]},
+                ),
+            )
+        return _openai
+
+def pool_stats():
+    """
+    各連線池的使用狀況
+    in_flight: 目前進行中的請求；peak: 歷史最高併發；connections: 累計建立的連線數 (握手次數)
+    idle: 目前閒置可重用的連線
+    """
+    with _lock:
+        sessions = list(_sessions.values())
+    stats = {}
+    for s in sessions:
+        connections, idle = 0, 0
+        adapter = s.get_adapter("https://")
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None: continue
+            connections += pool.num_connections
+            idle += pool.pool.qsize() if pool.pool else 0
+        stats[s.name] = {
+            "in_flight": s.in_flight, "peak": s.peak, "requests": s.requests,
+            "connections": connections, "idle": idle, "pool_size": POOL_SIZE,
+        }
+    stats["openai"] = {"requests": metrics.snapshot()["counters"].get("http.openai.requests", 0)}
+    return stats
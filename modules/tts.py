@@ -0,0 +1,165 @@
+import random
+import time
+import httpx
+import openai
+import streamlit as st
+from collections import deque
+from modules import tts_cache, health, metrics, transport
+
+# ==========================================
+# TTS 引擎抽象層 (逾時 + 健康狀態 + 斷路器 + 額度感知)
+# ==========================================
+# 依序嘗試 BACKENDS：快取 -> 健康檢查 -> 合成
+# 連線/讀取逾時分開設定，避免一條卡住的連線拖住 Streamlit 執行緒
+# 額度用完 (quota_exceeded / insufficient_quota) 才暫停該引擎一段時間，不算故障
+# 併發上限的 429 是暫時的：加抖動重試幾次，還是忙就只有這一句改用下一個引擎
+# 呼叫端造成的 4xx (voice_id 已刪除、文字不合法) 不計入斷路器，避免一個壞請求影響所有人
+
+# TTS 參數 (同時也是快取 key 的一部分)
+EL_MODEL_ID = "eleven_multilingual_v2"
+EL_VOICE_SETTINGS = {"stability": 0.5, "similarity_boost": 0.8}
+OPENAI_TTS_MODEL = "tts-1"
+OPENAI_TTS_VOICE = "alloy"
+
+EL_TIMEOUT = (3.05, 30) # (連線, 讀取) 秒
+OPENAI_TIMEOUT = (3.05, 30)
+QUOTA_BACKOFF = 60 # 沒有 Retry-After 時的預設暫停秒數
+BUSY_RETRIES = 2 # 併發上限 429 的重試次數
+BUSY_BACKOFF = 0.5 # 重試等待基準秒數 (乘上次數再加抖動)
+
+class TTSError(Exception):
+    pass
+
+class QuotaExceeded(TTSError):
+    def __init__(self, message, retry_after=QUOTA_BACKOFF):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Busy(TTSError):
+    """暫時性的速率/併發限制，重試後仍失敗"""
+
+class RequestRejected(TTSError):
+    """呼叫端造成的 4xx，跟引擎健康無關"""
+
+def _busy_wait(attempt):
+    time.sleep(BUSY_BACKOFF * (attempt + 1) * random.uniform(0.5, 1.5))
+
+class ElevenLabsBackend:
+    name = "elevenlabs"
+    shared_voice = False # 快取依 voice_id 分開
+
+    def cache_key(self, text, voice_id):
+        return tts_cache.make_key(text, voice_id, EL_MODEL_ID, EL_VOICE_SETTINGS, self.name), voice_id
+
+    def _post(self, text, voice_id):
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+        headers = {"xi-api-key": st.secrets['ELEVENLABS_API_KEY'], "Content-Type": "application/json"}
+        data = {"text": text, "model_id": EL_MODEL_ID, "voice_settings": EL_VOICE_SETTINGS}
+        for attempt in range(BUSY_RETRIES + 1):
+            res = transport.session("elevenlabs").post(url, json=data, headers=headers, timeout=EL_TIMEOUT)
+            if res.status_code == 200: return res
+            body = res.text[:300]
+            res.close()
+            if "quota_exceeded" in body:
+                raise QuotaExceeded(f"EL {res.status_code}: {body}", float(res.headers.get("Retry-After", QUOTA_BACKOFF)))
+            if res.status_code != 429: break
+            if attempt < BUSY_RETRIES: _busy_wait(attempt) # too_many_concurrent_requests / system_busy
+        if res.status_code == 429: raise Busy(f"EL 429: {body}")
+        if 400 <= res.status_code < 500: raise RequestRejected(f"EL {res.status_code}: {body}")
+        raise TTSError(f"EL {res.status_code}: {body}")
+
+    def synthesize(self, text, voice_id):
+        return self._post(text, voice_id).content
+
+class OpenAIBackend:
+    name = "openai"
+    shared_voice = True # 固定用 alloy，跟誰的聲音無關
+    _client = None
+
+    @property
+    def client(self):
+        # 共用 transport 的連線池，只換逾時與重試設定
+        if OpenAIBackend._client is None:
+            OpenAIBackend._client = transport.openai_client().with_options(
+                timeout=httpx.Timeout(OPENAI_TIMEOUT[1], connect=OPENAI_TIMEOUT[0]),
+                max_retries=0
+            )
+        return OpenAIBackend._client
+
+    def cache_key(self, text, voice_id):
+        return tts_cache.make_key(text, OPENAI_TTS_VOICE, OPENAI_TTS_MODEL, None, self.name), OPENAI_TTS_VOICE
+
+    def _translate(self, e):
+        """OpenAI 例外轉成本模組的錯誤分類"""
+        if isinstance(e, openai.RateLimitError):
+            if getattr(e, "code", None) == "insufficient_quota": return QuotaExceeded(f"OpenAI 429: {e}")
+            return Busy(f"OpenAI 429: {e}")
+        if isinstance(e, openai.APIStatusError) and 400 <= e.status_code < 500:
+            return RequestRejected(f"OpenAI {e.status_code}: {e}")
+        return e
+
+    def synthesize(self, text, voice_id):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return self.client.audio.speech.create(model=OPENAI_TTS_MODEL, voice=OPENAI_TTS_VOICE, input=text).content
+            except openai.APIStatusError as e:
+                err = self._translate(e)
+                if not isinstance(err, Busy) or attempt == BUSY_RETRIES: raise err
+                _busy_wait(attempt)
+
+BACKENDS = [ElevenLabsBackend(), OpenAIBackend()]
+
+# 最近的請求紀錄：哪個引擎、花多久 (給後台/除錯看)
+_recent = deque(maxlen=200)
+
+def _log(engine, latency, text, cached=False):
+    _recent.append({"engine": engine, "latency": latency, "chars": len(text), "cached": cached, "at": time.time()})
+    metrics.incr(f"tts.served.{engine}" + (".cached" if cached else ""))
+    if not cached: metrics.record(f"tts.{engine}", latency)
+
+def _health(backend):
+    return health.get(f"tts/{backend.name}")
+
+def synthesize(text, voice_id, persist=True, engines=None):
+    """
+    依引擎順序合成，回傳 (MP3 bytes, 引擎名稱)；全部失敗回傳 (None, None)
+    persist: 結果是否寫入 TTS 磁碟快取
+    engines: 只用這些引擎 (例如語音包只收 ElevenLabs 的聲音)，None 為全部
+    """
+    for backend in BACKENDS:
+        if engines and backend.name not in engines: continue
+        key, cache_voice = backend.cache_key(text, voice_id)
+        cached = tts_cache.get(key, cache_voice)
+        if cached:
+            _log(backend.name, 0.0, text, cached=True)
+            return cached, backend.name
+
+        h = _health(backend)
+        if not h.allow():
+            metrics.incr(f"tts.skipped.{backend.name}")
+            continue
+        start = time.perf_counter()
+        try:
+            data = backend.synthesize(text, voice_id)
+        except QuotaExceeded as e:
+            print(f"TTS Quota ({backend.name}): {e}")
+            h.block_for(e.retry_after)
+            continue
+        except (Busy, RequestRejected) as e:
+            print(f"TTS Skipped ({backend.name}): {e}")
+            metrics.incr(f"tts.{type(e).__name__.lower()}.{backend.name}")
+            h.release()
+            continue
+        except Exception as e:
+            print(f"TTS Error ({backend.name}): {e}")
+            h.record_failure(time.perf_counter() - start)
+            continue
+        elapsed = time.perf_counter() - start
+        h.record_success(elapsed)
+        _log(backend.name, elapsed, text)
+        tts_cache.put(key, cache_voice, data, persist=persist or backend.shared_voice)
+        return data, backend.name
+    return None, None
+
+def recent():
+    return list(_recent)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from modules import metrics
+from modules.cache import LRUCache
+
+# ==========================================
+# TTS 內容定址快取 (記憶體 LRU + 本機磁碟)
+# ==========================================
+# key = sha256(text, voice_id, model_id, voice_settings, engine)
+# 磁碟路徑：.cache/tts/<voice_id>/<key>.mp3 (同一個聲音放同一個資料夾，方便整批失效)
+# 磁碟層有位元組上限：超過就依 mtime 淘汰最久沒用到的檔案 (命中時會更新 mtime)
+# LLM 生成的台詞多半只出現一次，沒有上限的話 .cache/tts 會無限長大
+
+CACHE_DIR = os.path.join(".cache", "tts")
+MEMORY_BUDGET = 64 * 1024 * 1024 # 記憶體層上限 64MB
+DISK_BUDGET = 512 * 1024 * 1024 # 磁碟層上限 512MB
+DISK_LOW_WATER = 0.9 # 淘汰到上限的九成，不必每次寫入都掃一次資料夾
+
+_memory = LRUCache(max_bytes=MEMORY_BUDGET)
+_lock = threading.Lock()
+_disk_lock = threading.Lock()
+_disk_bytes = None # 磁碟層目前大小 (第一次寫入時掃描；失效後重掃)
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_evictions": 0}
+
+def make_key(text, voice_id, model_id, voice_settings, engine):
+    raw = json.dumps([text, voice_id, model_id, voice_settings, engine], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _safe(voice_id):
+    return "".join(c for c in str(voice_id) if c.isalnum() or c in "-_") or "default"
+
+def _path(voice_id, key):
+    return os.path.join(CACHE_DIR, _safe(voice_id), f"{key}.mp3")
+
+def _bump(name):
+    with _lock:
+        _stats[name] += 1
+    metrics.incr(f"tts_cache.{name}")
+
+def get(key, voice_id):
+    """依序查記憶體 -> 磁碟，都沒有則回傳 None"""
+    data = _memory.get((voice_id, key))
+    if data is not None:
+        _bump("memory_hits")
+        return data
+    try:
+        path = _path(voice_id, key)
+        with open(path, "rb") as f:
+            data = f.read()
+        try: os.utime(path) # 淘汰依 mtime，命中就算「最近用過」
+        except OSError: pass
+        _memory.put((voice_id, key), data)
+        _bump("disk_hits")
+        return data
+    except OSError:
+        _bump("misses")
+        return None
+
+def put(key, voice_id, data, persist=True):
+    """
+    寫入快取
+    persist: 是否寫入磁碟 (訪客的暫時 Voice ID 離開即銷毀，不需落地)
+    """
+    if not data: return
+    _memory.put((voice_id, key), data)
+    if not persist: return
+    try:
+        path = _path(voice_id, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"TTS Cache Write Error: {e}")
+        return
+    _account(len(data) - old)
+
+def _disk_files():
+    """[(mtime, size, path), ...] 磁碟層所有快取檔"""
+    files = []
+    for root, _, names in os.walk(CACHE_DIR):
+        for name in names:
+            if not name.endswith(".mp3"): continue
+            path = os.path.join(root, name)
+            try: st = os.stat(path)
+            except OSError: continue
+            files.append((st.st_mtime, st.st_size, path))
+    return files
+
+def _account(delta):
+    """更新磁碟層大小，超過 DISK_BUDGET 就從最舊的檔案開始刪"""
+    global _disk_bytes
+    with _disk_lock:
+        if _disk_bytes is None: _disk_bytes = sum(size for _, size, _ in _disk_files())
+        else: _disk_bytes += delta
+        if _disk_bytes <= DISK_BUDGET: return
+        files = sorted(_disk_files())
+        _disk_bytes = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, size, path in files:
+            if _disk_bytes <= DISK_BUDGET * DISK_LOW_WATER: break
+            try: os.remove(path)
+            except OSError: continue
+            _disk_bytes -= size
+            evicted += 1
+    if evicted:
+        with _lock:
+            _stats["disk_evictions"] += evicted
+        metrics.incr("tts_cache.disk_evictions", evicted)
+
+def invalidate_voice(voice_id):
+    """聲音重新訓練後，舊的合成結果全部作廢"""
+    dropped = _memory.discard_where(lambda k: k[0] == voice_id)
+    folder = os.path.join(CACHE_DIR, _safe(voice_id))
+    try:
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+    except OSError: pass
+    global _disk_bytes
+    with _disk_lock:
+        _disk_bytes = None # 下次寫入時重新掃描
+    _write_revision(voice_id)
+    return dropped
+
+def voice_revision(voice_id):
+    """聲音的版本戳記 (每次失效都會更新)，給需要跟著聲音重建的資源比對用"""
+    try:
+        with open(os.path.join(CACHE_DIR, f"{_safe(voice_id)}.rev"), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return "0"
+
+def _write_revision(voice_id):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, f"{_safe(voice_id)}.rev"), "w") as f:
+            f.write(str(time.time_ns()))
+    except OSError: pass
+
+def stats():
+    with _lock:
+        s = dict(_stats)
+    total = s["memory_hits"] + s["disk_hits"] + s["misses"]
+    s["disk_bytes"] = _disk_bytes
+    s["hit_ratio"] = (s["memory_hits"] + s["disk_hits"]) / total if total else 0.0
+    s["memory"] = _memory.stats()
+    return s
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+import numpy as np
+import streamlit as st
+from modules import metrics
+
+# ==========================================
+# 本機向量索引 (取代 match_memories RPC 的選配方案)
+# ==========================================
+# 每個 (user_id, role) 一個正規化的 float32 矩陣，載入一次後隨存檔/刪除增量更新
+# 查詢 = 一次矩陣乘法 (cosine similarity) + argpartition 取 top-k
+# 在 secrets 設定 LOCAL_VECTOR_INDEX = true 啟用
+
+MATCH_THRESHOLD = 0.5
+MATCH_COUNT = 3
+
+_indexes = {}
+_lock = threading.Lock()
+
+def is_enabled():
+    try: return bool(st.secrets.get("LOCAL_VECTOR_INDEX", False))
+    except: return False
+
+def _to_vector(embedding):
+    # PostgREST 會把 pgvector 欄位序列化成字串 "[0.1,0.2,...]"
+    if isinstance(embedding, str): embedding = json.loads(embedding)
+    return np.asarray(embedding, dtype=np.float32)
+
+def _normalize(mat):
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+class MemoryIndex:
+    def __init__(self, rows):
+        self._lock = threading.Lock()
+        self.ids = [r['id'] for r in rows]
+        self.contents = [r['content'] for r in rows]
+        if rows:
+            self.matrix = _normalize(np.stack([_to_vector(r['embedding']) for r in rows]))
+        else:
+            self.matrix = None
+
+    def add(self, rows):
+        rows = [r for r in rows if r.get('embedding') is not None]
+        if not rows: return
+        vecs = _normalize(np.stack([_to_vector(r['embedding']) for r in rows]))
+        with self._lock:
+            self.ids += [r['id'] for r in rows]
+            self.contents += [r['content'] for r in rows]
+            self.matrix = vecs if self.matrix is None else np.vstack([self.matrix, vecs])
+
+    def remove(self, ids):
+        doomed = set(ids)
+        with self._lock:
+            keep = [i for i, mid in enumerate(self.ids) if mid not in doomed]
+            if len(keep) == len(self.ids): return
+            self.ids = [self.ids[i] for i in keep]
+            self.contents = [self.contents[i] for i in keep]
+            self.matrix = self.matrix[keep] if keep else None
+
+    def search(self, query_vec, threshold=MATCH_THRESHOLD, k=MATCH_COUNT):
+        """回傳與 match_memories RPC 相同形狀：[{"id", "content", "similarity"}, ...] (相似度高到低)"""
+        with self._lock:
+            matrix, ids, contents = self.matrix, self.ids, self.contents
+        if matrix is None: return []
+        q = _normalize(_to_vector(query_vec))
+        scores = matrix @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": ids[i], "content": contents[i], "similarity": float(scores[i])}
+            for i in top if scores[i] > threshold
+        ]
+
+    def __len__(self):
+        return len(self.ids)
+
+def get_index(supabase, user_id, role):
+    """取得 (user_id, role) 的索引，第一次會從資料庫整批載入"""
+    key = (user_id, role)
+    with _lock:
+        index = _indexes.get(key)
+    if index is not None: return index
+    res = supabase.table("memories").select("id, content, embedding").eq("user_id", user_id).eq("role", role).execute()
+    index = MemoryIndex(res.data or [])
+    with _lock:
+        return _indexes.setdefault(key, index)
+
+def on_inserted(user_id, role, rows):
+    """save_memory_fragments 寫入後呼叫 (索引尚未載入就略過，下次查詢時自然會載到)"""
+    with _lock:
+        index = _indexes.get((user_id, role))
+    if index is not None: index.add(rows)
+
+def on_deleted(user_id, role, ids):
+    with _lock:
+        index = _indexes.get((user_id, role))
+    if index is not None: index.remove(ids)
+
+def benchmark(supabase, user_id, role, query_vecs, rounds=5):
+    """
+    比較本機索引與 match_memories RPC 的查詢延遲 (秒)
+    回傳: {"local": {...}, "rpc": {...}, "speedup": x}
+    """
+    index = get_index(supabase, user_id, role)
+    results = {}
+    for name, fn in {
+        "local": lambda q: index.search(q),
+        "rpc": lambda q: supabase.rpc("match_memories", {
+            "query_embedding": q, "match_threshold": MATCH_THRESHOLD,
+            "match_count": MATCH_COUNT, "search_role": role
+        }).execute(),
+    }.items():
+        samples = []
+        for _ in range(rounds):
+            for q in query_vecs:
+                start = time.perf_counter()
+                fn(q)
+                samples.append(time.perf_counter() - start)
+                metrics.record(f"vector_index.bench.{name}", samples[-1])
+        samples.sort()
+        results[name] = {"avg": sum(samples) / len(samples), "p50": samples[len(samples) // 2], "max": samples[-1]}
+    results["speedup"] = results["rpc"]["avg"] / results["local"]["avg"] if results["local"]["avg"] else None
+    return results
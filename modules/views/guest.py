@@ -1,7 +1,8 @@
 import streamlit as st
 import random
 import time
-from modules import ui, database, audio, brain
+from modules import ui, database, audio, brain, crosstalk, prompt_pack
+from modules.config import GUEST_PROMPTS, TEASER_PROMPT
 
 def render(supabase, client, teaser_db):
     owner_data = st.session_state.guest_data
@@ -33,16 +34,19 @@ def render(supabase, client, teaser_db):
     if "teaser_stage" not in st.session_state: st.session_state.teaser_stage = "answer"
     if "first_answer_text" not in st.session_state: st.session_state.first_answer_text = ""
 
+    # 固定台詞語音包 (題庫或聲音變了會自動重建)
+    pack = prompt_pack.get_pack(teasers)
+
     # 1. 開場白 & 評分門檻
     if not st.session_state.has_rated and role_key == "friend":
         if "opening_played" not in st.session_state:
             op_bytes = audio.get_audio_bytes(supabase, role_key, "opening")
             
             # 【修改 1】 開場白文案更新
-            ai_ask = audio.generate_speech("你聽聽看這個AI分身怎麼樣？幫我打個分數。", tier)
+            ai_ask = prompt_pack.prompt_audio(pack, GUEST_PROMPTS["opening_ask"], tier)
             
             final = audio.merge_audio_clips(op_bytes, ai_ask) if op_bytes else ai_ask
-            if final: st.audio(final, format="audio/mp3", autoplay=True)
+            if final: st.audio(bytes(final), format="audio/mp3", autoplay=True)
             st.session_state.opening_played = True
             
         ui.render_status_bar(tier, energy, 0, "elevenlabs", is_guest=True, member_name=display_name)
@@ -60,9 +64,8 @@ def render(supabase, client, teaser_db):
             st.balloons()
             
             # 【修改 2】 增加文字停頓符號，並加長 Sleep 時間
-            thx_text = "謝啦！... 幫我等級加了1分。... 現在解鎖腦筋急轉彎模式！... 答對有彩蛋！！........."
-            thx = audio.generate_speech(thx_text, tier)
-            st.audio(thx, format="audio/mp3", autoplay=True)
+            thx = prompt_pack.prompt_audio(pack, GUEST_PROMPTS["thanks"], tier)
+            if thx: st.audio(bytes(thx), format="audio/mp3", autoplay=True)
             
             # 延長暫停時間至 8 秒，確保語音播完
             time.sleep(8) 
@@ -93,9 +96,9 @@ def render(supabase, client, teaser_db):
                     if st.session_state.teaser_stage == "answer":
                         if f"q_played_{st.session_state.teaser_idx}" not in st.session_state:
                             # 題目語音
-                            q_text = f"...請問!...{current_q['q']}，猜猜看是什麼？"
-                            q_audio = audio.generate_speech(q_text, tier)
-                            st.audio(q_audio, format="audio/mp3", autoplay=True)
+                            q_text = TEASER_PROMPT.format(q=current_q['q'])
+                            q_audio = prompt_pack.prompt_audio(pack, q_text, tier)
+                            if q_audio: st.audio(bytes(q_audio), format="audio/mp3", autoplay=True)
                             st.session_state[f"q_played_{st.session_state.teaser_idx}"] = True
                         
                         st.info("💡 **不知道答案嗎?** 請說: 「天靈靈地靈靈...谷哥大神幫助我解題」")
@@ -112,31 +115,25 @@ def render(supabase, client, teaser_db):
                     # 階段二：假裝沒聽清楚
                     elif st.session_state.teaser_stage == "retry":
                         if "retry_played" not in st.session_state:
-                            retry_text = "哎呀... 訊號不好，我沒聽清楚。... 麻煩你幫我唸這句測試一下... "
-                            retry_audio = audio.generate_speech(retry_text, tier)
-                            st.audio(retry_audio, format="audio/mp3", autoplay=True)
+                            retry_audio = prompt_pack.prompt_audio(pack, GUEST_PROMPTS["retry"], tier)
+                            if retry_audio: st.audio(bytes(retry_audio), format="audio/mp3", autoplay=True)
                             st.session_state.retry_played = True
                         
                         st.warning("🎤 請跟著唸：**「麥克風測試.1.2.3.4.甲乙丙丁」**")
                         spell_audio = st.audio_input("唸出測試語句", key=f"rec_spell_{st.session_state.teaser_idx}")
                         
                         if spell_audio:
-                            with st.spinner("🔄 正在分析聲紋特徵... 生成雙人相聲中... (需約 10 秒)"):
-                                if not st.session_state.guest_voice_id:
-                                    spell_audio.seek(0)
-                                    st.session_state.guest_voice_id = audio.clone_guest_voice(spell_audio.read())
+                            with st.spinner("🔄 正在分析聲紋特徵... 生成雙人相聲中..."):
+                                spell_audio.seek(0)
+                                spell_bytes = spell_audio.read()
                                 
-                                # 生成劇本 (傳入正確答案)
+                                # 複製聲音 + 生成劇本 (傳入正確答案) 平行進行，逐句 TTS 併發
                                 user_content = st.session_state.first_answer_text
-                                script = brain.generate_crosstalk_script(current_q['q'], current_q['a'], user_content, display_name)
-                                
-                                audio_clips = []
-                                for line in script:
-                                    spk = st.session_state.guest_voice_id if line['speaker'] == 'guest' else None
-                                    clip = audio.generate_speech(line['text'], tier, specific_voice_id=spk)
-                                    audio_clips.append(clip)
-                                
-                                full_audio = audio.merge_dialogue(audio_clips)
+                                full_audio, voice_id, _ = crosstalk.render_crosstalk(
+                                    spell_bytes, st.session_state.guest_voice_id,
+                                    current_q['q'], current_q['a'], user_content, display_name, tier
+                                )
+                                st.session_state.guest_voice_id = voice_id
                                 st.session_state.crosstalk_audio = full_audio
                                 database.update_profile_stats(supabase, owner_id, xp_delta=1)
                                 
@@ -1,7 +1,7 @@
 import streamlit as st
 import base64
 import os
-from modules import ui, database, audio, config, gamification
+from modules import ui, database, audio, config, gamification, page_loader
 from modules.tabs import tab_voice, tab_store, tab_persona, tab_memory
 
 def get_base64_encoded_image(image_path):
@@ -11,12 +11,32 @@ def get_base64_encoded_image(image_path):
             return base64.b64encode(img_file.read()).decode('utf-8')
     except: return None
 
+ROLE_KEY = "member_target_role"
+DEFAULT_ROLE = "朋友/死黨"
+
+def load_page(supabase, user_id, target_role):
+    """
+    一次渲染需要的資料，同時抓 (見 page_loader.py)
+    persona / memories 會留在 session 快取，分頁裡再讀不會打資料庫
+    """
+    loader = page_loader.PageLoader("member")
+    loader.add("profile", database.get_user_profile, supabase, default={})
+    loader.add("similarity", gamification.calculate_similarity, supabase, user_id, target_role, default=(50, "", 0))
+    loader.add("has_op", audio.has_audio, supabase, target_role, "opening", default=False)
+    loader.add("persona", database.load_persona, supabase, target_role)
+    loader.add("memories", database.get_memories_by_role, supabase, target_role, default=[])
+    return loader.load()
+
 def render(supabase, client, question_db):
-    profile = database.get_user_profile(supabase)
+    user_id = st.session_state.user.user.id
+    # 角色選單還沒畫出來，先用上次的選擇 (第一次是預設值) 預抓
+    predicted_role = config.ROLE_MAPPING.get(st.session_state.get(ROLE_KEY, DEFAULT_ROLE), "friend")
+    page = load_page(supabase, user_id, predicted_role)
+
+    profile = page["profile"] or {}
     tier = profile.get('tier', 'basic')
     xp = profile.get('xp', 0)
     energy = profile.get('energy', 30)
-    user_id = st.session_state.user.user.id
     
     # ==========================================
     # 1. Header (Logo + 標題) - 分欄版
@@ -54,15 +74,18 @@ def render(supabase, client, question_db):
     # ==========================================
     
     # 為了計算狀態列的分數，我們先渲染控制台來確定 target_role
-    allowed = ["朋友/死黨"]
+    allowed = [DEFAULT_ROLE]
     if tier != 'basic' or xp >= 20: allowed = list(config.ROLE_MAPPING.keys())
     
     # 底部對齊
     c_role, c_btn = st.columns([7, 3], vertical_alignment="bottom")
     
     with c_role:
-        disp_role = st.selectbox("選擇對象", allowed, label_visibility="collapsed")
+        disp_role = st.selectbox("選擇對象", allowed, label_visibility="collapsed", key=ROLE_KEY)
         target_role = config.ROLE_MAPPING[disp_role]
+
+    # 猜錯 (例如等級變動導致選項重置) 就用實際角色重抓一次
+    if target_role != predicted_role: page = load_page(supabase, user_id, target_role)
     
     with c_btn:
         if st.button("🎁 生成邀請卡", type="primary", use_container_width=True):
@@ -75,19 +98,19 @@ def render(supabase, client, question_db):
     # ==========================================
     
     # 計算相似度
-    sim_score, sim_hint, sim_gain = gamification.calculate_similarity(supabase, user_id, target_role)
+    sim_score, sim_hint, sim_gain = page["similarity"]
     
     # 顯示狀態列
     ui.render_status_bar(tier, energy, xp, audio.get_tts_engine_type(profile), sim_score, sim_hint, sim_gain)
     
     # 提示訊息
-    has_op = audio.get_audio_bytes(supabase, target_role, "opening")
+    has_op = page["has_op"]
     if not has_op and target_role == "friend": st.caption("⚠️ 尚未錄製口頭禪")
 
     # 邀請卡彈窗
     if st.session_state.show_invite:
         tk = st.session_state.get("current_token", "ERR")
-        pd = database.load_persona(supabase, target_role)
+        pd = page["persona"]
         mn = pd.get('member_nickname', '我') if pd else '我'
         url = f"https://missyou.streamlit.app/?token={tk}_{mn}"
         
@@ -0,0 +1,24 @@
+-- ==========================================
+-- audio_assets：錄音檔清單 (upload_audio_file 維護)
+-- ==========================================
+-- 判斷某段錄音是否存在只需查這張表，不必從 Storage 下載整個檔案
+-- role 與 Storage 路徑相同 (ROLE_MAPPING 轉換後的代號)
+
+create table if not exists audio_assets (
+    user_id uuid not null,
+    role text not null,
+    file_type text not null,
+    path text not null,
+    size_bytes integer,
+    duration_ms integer,
+    sha256 text,
+    content_type text,
+    updated_at timestamptz default now(),
+    primary key (user_id, role, file_type)
+);
+
+-- 已從 Storage 目錄回填過 audio_assets 的使用者 (每人只回填一次，之後只查清單)
+create table if not exists audio_asset_backfills (
+    user_id uuid primary key,
+    done_at timestamptz default now()
+);
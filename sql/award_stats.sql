@@ -0,0 +1,57 @@
+-- ==========================================
+-- award_stats：XP / 電量原子更新 (取代 Python 端的讀取-計算-寫回)
+-- ==========================================
+-- 一次呼叫完成：唯一獎勵檢查 -> 加減分 (不低於 0) -> 寫入 transaction_logs
+-- p_log = false 時不寫 transaction_logs (由應用端 log_writer 批次寫入)
+-- 唯一獎勵先搶 claimed_rewards 主鍵 (sql/claimed_rewards.sql)，併發重複領取只會成功一次
+-- 回傳 applied = false 代表已領取過
+--
+-- 在 Supabase SQL Editor 依序執行 claimed_rewards.sql、本檔；本機壓測見 award_stats_bench.sql
+
+-- 參數有變動時需先 drop 舊版本
+drop function if exists award_stats(uuid, integer, integer, text, boolean);
+
+create or replace function award_stats(
+    p_user_id uuid,
+    p_xp_delta integer default 0,
+    p_energy_delta integer default 0,
+    p_reason text default '',
+    p_unique boolean default false,
+    p_log boolean default true
+)
+returns table (applied boolean, xp integer, energy integer)
+language plpgsql
+as $$
+declare
+    v_xp integer;
+    v_energy integer;
+begin
+    if p_unique and coalesce(p_reason, '') <> '' then
+        insert into claimed_rewards (user_id, reason)
+        values (p_user_id, p_reason)
+        on conflict do nothing;
+        if not found then
+            return query select false, null::integer, null::integer;
+            return;
+        end if;
+    end if;
+
+    update profiles p
+       set xp = greatest(0, coalesce(p.xp, 0) + p_xp_delta),
+           energy = greatest(0, coalesce(p.energy, 30) + p_energy_delta)
+     where p.user_id = p_user_id
+    returning p.xp, p.energy into v_xp, v_energy;
+
+    if not found then
+        -- 找不到使用者：例外讓整個交易 (含 claimed_rewards) 回滾
+        raise exception 'profile % not found', p_user_id;
+    end if;
+
+    if p_log and coalesce(p_reason, '') <> '' then
+        insert into transaction_logs (user_id, amount, reason)
+        values (p_user_id, case when p_xp_delta <> 0 then p_xp_delta else p_energy_delta end, p_reason);
+    end if;
+
+    return query select true, v_xp, v_energy;
+end;
+$$;
@@ -0,0 +1,43 @@
+-- ==========================================
+-- award_stats 本機併發測試 (純 Postgres，不需 Supabase)
+-- ==========================================
+-- 1. 建立測試資料庫並載入：
+--      createdb echosoul_test
+--      psql echosoul_test -f award_stats_bench.sql      (建立最小資料表 + 測試帳號)
+--      psql echosoul_test -f claimed_rewards.sql
+--      psql echosoul_test -f award_stats.sql
+-- 2. 20 個連線同時各加 50 次 XP，並搶同一個唯一獎勵 (腳本見 award_stats_pgbench.sql)：
+--      pgbench -n -c 20 -j 4 -t 50 -f award_stats_pgbench.sql echosoul_test
+-- 3. 驗證：xp 應為 1000 + 5，唯一獎勵只記錄一次，不符合時丟出例外：
+--      psql -v ON_ERROR_STOP=1 echosoul_test -f award_stats_verify.sql
+-- 重跑前再執行一次本檔即可把測試帳號歸零
+
+create table if not exists profiles (
+    user_id uuid primary key,
+    xp integer default 0,
+    energy integer default 30,
+    tier text default 'basic',
+    last_interaction_date text
+);
+
+create table if not exists transaction_logs (
+    id bigserial primary key,
+    user_id uuid not null,
+    amount integer,
+    reason text,
+    created_at timestamptz default now()
+);
+
+insert into profiles (user_id) values ('00000000-0000-0000-0000-000000000001')
+on conflict do nothing;
+
+-- 重跑時歸零 (claimed_rewards 第一次執行時還沒建立)
+update profiles set xp = 0, energy = 30 where user_id = '00000000-0000-0000-0000-000000000001';
+delete from transaction_logs where user_id = '00000000-0000-0000-0000-000000000001';
+do $$
+begin
+    if to_regclass('claimed_rewards') is not null then
+        delete from claimed_rewards where user_id = '00000000-0000-0000-0000-000000000001';
+    end if;
+end;
+$$;
@@ -0,0 +1,4 @@
+-- award_stats 併發測試的 pgbench 腳本 (用法見 award_stats_bench.sql)
+-- 每個交易：加 1 XP (可重複獎勵) + 搶同一個唯一獎勵 (+5 XP，只會成功一次)
+select award_stats('00000000-0000-0000-0000-000000000001', 1, 0, '朋友評分獎勵', false);
+select award_stats('00000000-0000-0000-0000-000000000001', 5, 0, '完成Step1', true);
@@ -0,0 +1,25 @@
+-- ==========================================
+-- award_stats 併發測試結果驗證 (用法見 award_stats_bench.sql)
+-- ==========================================
+-- 預設 pgbench -c 20 -t 50：1000 次 +1 XP，唯一獎勵 +5 只成功一次
+-- 不符合預期時丟出例外 (psql -v ON_ERROR_STOP=1 會以非 0 結束)
+
+select xp, (select count(*) from transaction_logs where reason = '完成Step1') as step1_rows,
+       (select count(*) from claimed_rewards where reason = '完成Step1') as step1_claims
+from profiles where user_id = '00000000-0000-0000-0000-000000000001';
+
+do $$
+declare
+    v_xp integer;
+    v_logs integer;
+    v_claims integer;
+begin
+    select xp into v_xp from profiles where user_id = '00000000-0000-0000-0000-000000000001';
+    select count(*) into v_logs from transaction_logs where reason = '完成Step1';
+    select count(*) into v_claims from claimed_rewards where reason = '完成Step1';
+    if v_xp <> 1005 then raise exception 'xp = %, expected 1005', v_xp; end if;
+    if v_logs <> 1 then raise exception '完成Step1 logs = %, expected 1', v_logs; end if;
+    if v_claims <> 1 then raise exception '完成Step1 claims = %, expected 1', v_claims; end if;
+    raise notice 'award_stats concurrency check passed (xp = 1005, one 完成Step1)';
+end;
+$$;
@@ -0,0 +1,28 @@
+-- ==========================================
+-- claimed_rewards：唯一獎勵索引
+-- ==========================================
+-- (user_id, reason) 為主鍵，檢查是否領過 = 一次索引查找
+-- 併發重複領取由主鍵衝突直接擋下 (award_stats 內 on conflict do nothing)
+-- 請在 award_stats.sql 之前執行
+
+create table if not exists claimed_rewards (
+    user_id uuid not null,
+    reason text not null,
+    claimed_at timestamptz default now(),
+    primary key (user_id, reason)
+);
+
+-- 既有紀錄回填 (舊版以 transaction_logs 是否存在判斷是否領過)
+-- 只回填一次性的獎勵 (錄音訓練各步驟)；朋友評分、每日結算、升級、邀請等可重複發放的原因不能放進來，
+-- 否則之後以 unique 領取會被誤判為已領過。新增 unique 獎勵時把原因補進這個清單
+insert into claimed_rewards (user_id, reason)
+select distinct user_id, reason from transaction_logs
+where reason in ('完成Step1', 'Step2', 'Step3', 'Step4')
+on conflict do nothing;
+
+-- 已執行過舊版 (不分原因全部回填) 的資料庫：清掉誤填的可重複原因
+delete from claimed_rewards
+where reason = '朋友評分獎勵'
+   or reason like '每日結算%'
+   or reason like '升級 %'
+   or reason like '邀請獎勵:%';